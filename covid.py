@@ -1,24 +1,40 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import time
+
+START_TIME = time.perf_counter()
+
+import argparse
+import hashlib
+import json
 import os
+import pickle
 import shutil
 import sys
 import tempfile
+import threading
+import traceback
+import tracemalloc
+import weakref
+from bisect import bisect_left
+from contextlib import contextmanager
 from datetime import date, datetime, timedelta
+from functools import partial
 from itertools import cycle
 
-import imageio
 import numpy as np
 import pandas as pd
-import requests
-from bokeh.events import MenuItemClick
-from bokeh.io import export_png
+from bokeh.document import Document
+from bokeh.events import DocumentReady, MenuItemClick
 from bokeh.layouts import column, row
 from bokeh.models import (
     BasicTicker,
     ColorBar,
     ColumnDataSource,
+    CustomJS,
+    CustomJSTransform,
+    FactorRange,
     HoverTool,
     LinearAxis,
     LinearColorMapper,
@@ -36,42 +52,95 @@ from bokeh.models.widgets import (
     Dropdown,
     MultiSelect,
     RadioGroup,
+    TextInput,
+    Toggle,
 )
-from bokeh.palettes import Category20_3, Category20_20, Plasma256
+from bokeh.palettes import Category20_3, Category20_20, Plasma256, RdBu11
 from bokeh.plotting import curdoc, figure
-from bokeh.sampledata.us_counties import data as US_COUNTIES
-from bokeh.sampledata.us_states import data as US_STATES
-from tqdm import tqdm
-
-if "HI" in US_STATES:
-    del US_STATES["HI"]
-if "AK" in US_STATES:
-    del US_STATES["AK"]
+from bokeh.transform import transform
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.web import HTTPError, RequestHandler
 
 PALETTE = Plasma256
 
+GEOMETRY_TOLERANCES = (0.0, 0.005, 0.02, 0.05)
+ADJACENCY_RADIUS = 0.001
+
 POP_DATA = pd.read_csv("pop_data.csv")
+POP_LOOKUP = dict(zip(POP_DATA["NAME"], POP_DATA["B01003_001E"]))
 
-NNL_POP = {
-    "NNL Bettis": 2791,
-    "NNL Knolls": 2226,
-    "NNL Kesselring": 286,
-    "NNL NPTU-Charleston": 352,
-    "NNL NRF": 1401,
-    "NNL Liberty Street": 331,
-    "Non-NNL Bettis": 226,
-    "Non-NNL Knolls": 137,
-    "Non-NNL Kesselring": 524,
-    "Non-NNL NPTU-Charleston": 1,
-    "Non-NNL NRF": 224,
-    "Non-NNL Liberty Street": 105,
-}
+NNL_SITES = pd.read_csv("nnl-sites.csv")
+
+NNL_POP = dict(zip(NNL_SITES["name"], NNL_SITES["population"]))
+NNL_COUNTIES = dict(zip(NNL_SITES["name"], NNL_SITES["county"]))
 
 ROLLING = timedelta(days=7)
 NNL_ROLLING = timedelta(days=7)
 ROLLING_DAYS = int(ROLLING / timedelta(days=1))
 NNL_ROLLING_DAYS = int(NNL_ROLLING / timedelta(days=1))
 
+ROLLING_WINDOWS = (3, 7, 14, 28)
+
+HISTORY_WINDOW = timedelta(days=90)
+COARSE_STEP = 7
+
+SEARCH_LIMIT = 20
+
+RANKING_METRICS = (
+    "Cases per 100,000",
+    "Deaths per 100,000",
+    "New Cases",
+    "Week-over-Week Growth",
+)
+TOP_COUNTS = (10, 20, 50)
+
+GROWTH_DAYS = 14
+GROWTH_MAX = 100
+
+PROJECTION_DAYS = 14
+PROJECTION_Z = 1.96
+
+CORRELATION_LAGS = 21
+CORRELATION_MIN_DAYS = 28
+
+PATCH_FRACTION = 0.25
+
+UPDATE_STAGES = ("data", "totals", "layout", "view")
+
+UNSCALED_TYPES = ("positivity", "weekly growth")
+
+SCALE_LINES_JS = """
+if (toggle.active != 1) {
+    return xs
+}
+const scale = source.data["scale"]
+return xs.map(
+    (values, i) => Float64Array.from(values, (value) => value / scale[i])
+)
+"""
+
+SCALE_VALUES_JS = """
+if (toggle.active != 1) {
+    return xs
+}
+const scale = source.data["scale"]
+return Float64Array.from(xs, (value, i) => value / scale[i])
+"""
+
+PER_CAPITA_JS = """
+for (const axis of axes) {
+    axis.axis_label = labels[cb_obj.active]
+}
+for (const source of sources) {
+    source.change.emit()
+}
+"""
+
+PLOT_TYPE_JS = """
+p.visible = cb_obj.active == 0
+logp.visible = cb_obj.active == 1
+"""
+
 EMPTY_COUNTIES = {
     "Alaska": ["Borough", "Census Area"],
     "District of Columbia": ["District of Columbia"],
@@ -126,51 +195,215 @@ REPLACE_COUNTIES = {
     "New Mexico": {"Doña Ana": "Do�a Ana County, New Mexico"},
 }
 
-if os.path.exists("us-states.csv"):
-    GH_STATES_DATA = pd.read_csv(
-        "us-states.csv", parse_dates=["date", "avg_dates"]
-    )
-else:
-    GH_STATES_DATA = pd.read_csv(
-        os.path.join("covid-19-data", "us-states.csv"), parse_dates=["date"]
-    )
+COMPUTE_BACKEND = "pandas"
+BACKEND_TOLERANCE = 1e-9
+
+TRACKING_URL = "https://covidtracking.com/api/v1/states/daily.json"
+TRACKING_FILE = "covidtracking-daily.json"
+
+GENERATION_FILE = "generation.txt"
+OUTPUT_DIR = "outputs"
+OUTPUT_GENERATIONS = 5
+REPORT_FILE = os.path.join(OUTPUT_DIR, "preprocess-report.json")
+PREPROCESS_VERSION = 1
+GROUPS_FILE = "region-groups.csv"
+SNAPSHOT_DIR = "store"
+RELOAD_INTERVAL = 60000
+WATCH_INTERVAL = 30
+
+API_CACHE_SIZE = 512
+API_FORMATS = {
+    "json": "application/json",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
 
-if os.path.exists("us-counties.csv"):
-    GH_COUNTIES_DATA = pd.read_csv(
-        "us-counties.csv", parse_dates=["date", "avg_dates"]
-    )
-else:
-    GH_COUNTIES_DATA = pd.read_csv(
-        os.path.join("covid-19-data", "us-counties.csv"), parse_dates=["date"]
+DROP_STATES = [
+    "Guam",
+    "Northern Mariana Islands",
+    "Virgin Islands",
+    "Puerto Rico",
+]
+DROP_COUNTIES = DROP_STATES + ["Hawaii", "Alaska"]
+
+
+def read_states_data():
+
+    columns = ["date", "state", "cases", "deaths"]
+
+    if os.path.exists("us-states.csv"):
+        return pd.read_csv(
+            "us-states.csv", usecols=columns, parse_dates=["date"]
+        )
+
+    return pd.read_csv(
+        os.path.join("covid-19-data", "us-states.csv"),
+        usecols=columns,
+        parse_dates=["date"],
     )
 
-if os.path.exists("nnl-detailed.csv"):
-    NNL_DATA = pd.read_csv(
-        "nnl-detailed.csv", parse_dates=["date", "avg_dates"]
+
+def read_counties_data():
+
+    columns = ["date", "state", "county", "cases", "deaths"]
+
+    if os.path.exists("us-counties.csv"):
+        return pd.read_csv(
+            "us-counties.csv", usecols=columns, parse_dates=["date"]
+        )
+
+    return pd.read_csv(
+        os.path.join("covid-19-data", "us-counties.csv"),
+        usecols=columns,
+        parse_dates=["date"],
     )
 
-STATES = sorted(GH_STATES_DATA["state"].unique())
-COUNTIES = sorted(
-    {
-        f"{state}, {county}"
-        for county, state in zip(
-            GH_COUNTIES_DATA["county"], GH_COUNTIES_DATA["state"]
+
+def read_nnl_data():
+
+    if os.path.exists("nnl-detailed.csv"):
+        return pd.read_csv(
+            "nnl-detailed.csv",
+            usecols=["date", "site", "cases"],
+            parse_dates=["date"],
         )
+
+    return None
+
+
+def read_region_groups():
+
+    if not os.path.exists(GROUPS_FILE):
+        return dict()
+
+    groups = pd.read_csv(GROUPS_FILE)
+
+    return {
+        name: list(members)
+        for name, members in groups.groupby("group", sort=False)["region"]
     }
-)
 
-TRACKING_DATA = pd.DataFrame.from_dict(
-    requests.get(
-        url="https://covidtracking.com/api/v1/states/daily.json"
-    ).json()
-)
 
-TRACKING_DATA["datetime"] = [
-    datetime.strptime(str(x), "%Y%m%d") for x in TRACKING_DATA["date"]
-]
-TRACKING_DATA["positivity"] = (
-    TRACKING_DATA["positive"] / TRACKING_DATA["totalTestResults"] * 100
-)
+def fetch_tracking_data():
+
+    import requests
+
+    with open(f"{TRACKING_FILE}.tmp", "w") as fileobj:
+        json.dump(requests.get(url=TRACKING_URL).json(), fileobj)
+    os.replace(f"{TRACKING_FILE}.tmp", TRACKING_FILE)
+
+
+def read_tracking_payload():
+
+    if not os.path.exists(TRACKING_FILE):
+        fetch_tracking_data()
+
+    with open(TRACKING_FILE) as fileobj:
+        return pd.DataFrame.from_dict(json.load(fileobj))
+
+
+def compute_tracking_data(data):
+
+    data["datetime"] = [
+        datetime.strptime(str(x), "%Y%m%d") for x in data["date"]
+    ]
+    data["positivity"] = data["positive"] / data["totalTestResults"] * 100
+
+    return data
+
+
+def read_tracking_data():
+
+    if os.path.exists("us-tracking.csv"):
+        return pd.read_csv("us-tracking.csv", parse_dates=["datetime"])
+
+    return compute_tracking_data(read_tracking_payload())
+
+
+def read_generation():
+
+    if not os.path.exists(GENERATION_FILE):
+        return None
+
+    with open(GENERATION_FILE) as fileobj:
+        return fileobj.read().strip()
+
+
+def read_manifest(generation):
+
+    filename = os.path.join(OUTPUT_DIR, f"{generation}.json")
+
+    if generation is None or not os.path.exists(filename):
+        return None
+
+    with open(filename) as fileobj:
+        return json.load(fileobj)
+
+
+def write_generation(generation):
+
+    with open(f"{GENERATION_FILE}.tmp", "w") as fileobj:
+        fileobj.write(generation)
+    os.replace(f"{GENERATION_FILE}.tmp", GENERATION_FILE)
+
+
+def publish_generation(fingerprints):
+
+    generation = datetime.now().strftime("%Y%m%d%H%M%S%f")
+
+    write_snapshot(build_store(generation))
+
+    with open(os.path.join(OUTPUT_DIR, f"{generation}.json"), "w") as fileobj:
+        json.dump(fingerprints, fileobj)
+
+    write_generation(generation)
+
+    for name in os.listdir(SNAPSHOT_DIR):
+        if name != generation and not name.startswith("tmp"):
+            shutil.rmtree(os.path.join(SNAPSHOT_DIR, name), ignore_errors=True)
+
+    prune_outputs()
+
+    return generation
+
+
+def rollback(generation):
+
+    fingerprints = read_manifest(generation)
+    if fingerprints is None:
+        raise ValueError(f"no outputs recorded for generation {generation}")
+
+    install_outputs(fingerprints)
+    write_generation(generation)
+
+
+def prune_outputs():
+
+    generations = sorted(
+        name[: -len(".json")]
+        for name in os.listdir(OUTPUT_DIR)
+        if name.endswith(".json") and name[: -len(".json")].isdigit()
+    )
+
+    for generation in generations[:-OUTPUT_GENERATIONS]:
+        os.remove(os.path.join(OUTPUT_DIR, f"{generation}.json"))
+
+    keep = {
+        cached_output(name, fingerprint)
+        for generation in generations[-OUTPUT_GENERATIONS:]
+        for name, fingerprint in read_manifest(generation).items()
+    }
+
+    for name in os.listdir(OUTPUT_DIR):
+        filename = os.path.join(OUTPUT_DIR, name)
+        if name.endswith(".csv") and filename not in keep:
+            os.remove(filename)
+
+
+def write_output(data, filename):
+
+    data.to_csv(f"{filename}.tmp")
+    os.replace(f"{filename}.tmp", filename)
+
 
 STATE_ABBRV = {
     "Alabama": "AL",
@@ -227,134 +460,193 @@ STATE_ABBRV = {
 }
 
 
-def compute_states_data():
+class PandasBackend:
 
-    GH_STATES_DATA.sort_values("date", inplace=True)
-    for fips in tqdm(GH_STATES_DATA["fips"].unique()):
+    name = "pandas"
 
-        slicer = GH_STATES_DATA["fips"] == fips
-        subset = GH_STATES_DATA.loc[slicer, :]
+    def series(self, groups, values, days):
 
-        state = subset["state"].values[0]
-        pop = population(state)
+        values = pd.Series(values)
 
-        avg_dates = subset["date"] - ROLLING / 2
-        diff_cases = subset["cases"].diff()
-        diff_deaths = subset["deaths"].diff()
-        avg_cases = subset["cases"].diff().rolling(ROLLING_DAYS).mean()
-        avg_deaths = subset["deaths"].diff().rolling(ROLLING_DAYS).mean()
+        diff = values.groupby(groups).diff()
+        avg = (
+            diff.groupby(groups)
+            .rolling(days)
+            .mean()
+            .reset_index(level=0, drop=True)
+            .sort_index()
+        )
 
-        diff_cases_pc = diff_cases / pop * 100000
-        diff_deaths_pc = diff_deaths / pop * 100000
-        avg_cases_pc = avg_cases / pop * 100000
-        avg_deaths_pc = avg_deaths / pop * 100000
+        return diff.values, avg.values
 
-        GH_STATES_DATA.loc[subset.index, "diff_cases"] = diff_cases
-        GH_STATES_DATA.loc[subset.index, "diff_deaths"] = diff_deaths
-        GH_STATES_DATA.loc[subset.index, "diff_cases_pc"] = diff_cases_pc
-        GH_STATES_DATA.loc[subset.index, "diff_deaths_pc"] = diff_deaths_pc
-        GH_STATES_DATA.loc[subset.index, "avg_dates"] = avg_dates
-        GH_STATES_DATA.loc[subset.index, "avg_cases"] = avg_cases
-        GH_STATES_DATA.loc[subset.index, "avg_deaths"] = avg_deaths
-        GH_STATES_DATA.loc[subset.index, "avg_cases_pc"] = avg_cases_pc
-        GH_STATES_DATA.loc[subset.index, "avg_deaths_pc"] = avg_deaths_pc
 
+class NumpyBackend:
 
-def compute_counties_data():
+    name = "numpy"
 
-    subset = GH_COUNTIES_DATA.loc[:, ("state", "county")]
-    state_county = set()
-    for index, irow in tqdm(subset.iterrows()):
-        if irow["county"].lower() != "unknown":
-            state_county.add((irow["state"], irow["county"]))
-    state_county = sorted(state_county)
+    def series(self, groups, values, days):
+
+        order = np.argsort(groups, kind="stable")
+        ordered = groups[order]
+        starts = np.ones(len(ordered), dtype=bool)
+        starts[1:] = ordered[1:] != ordered[:-1]
+
+        diff = np.empty(len(values))
+        diff[0:1] = np.nan
+        np.subtract(values[order][1:], values[order][:-1], out=diff[1:])
+        diff[starts] = np.nan
+
+        avg = np.full(len(values), np.nan)
+        if len(values) >= days:
+            windows = np.lib.stride_tricks.sliding_window_view(diff, days)
+            avg[days - 1 :] = windows.sum(axis=1) / days
+
+        result_diff = np.empty(len(values))
+        result_avg = np.empty(len(values))
+        result_diff[order] = diff
+        result_avg[order] = avg
+
+        return result_diff, result_avg
+
+
+class PolarsBackend:
+
+    name = "polars"
+
+    def __init__(self):
+
+        import polars
+
+        self.pl = polars
+
+    def series(self, groups, values, days):
+
+        pl = self.pl
+
+        frame = (
+            pl.LazyFrame({"group": groups, "value": values})
+            .with_columns(pl.col("value").diff().over("group").alias("diff"))
+            .with_columns(
+                pl.col("diff").rolling_mean(days).over("group").alias("avg")
+            )
+            .collect()
+        )
+
+        return frame["diff"].to_numpy(), frame["avg"].to_numpy()
 
-    GH_COUNTIES_DATA.sort_values("date", inplace=True)
-    for state, county in tqdm(state_county):
 
-        slicer = (GH_COUNTIES_DATA["state"] == state).values & (
-            GH_COUNTIES_DATA["county"] == county
-        ).values
-        subset = GH_COUNTIES_DATA.loc[slicer, :]
+COMPUTE_BACKENDS = {
+    "pandas": PandasBackend,
+    "numpy": NumpyBackend,
+    "polars": PolarsBackend,
+}
+
+
+def compute_backend(name=None):
+    return COMPUTE_BACKENDS[name or COMPUTE_BACKEND]()
+
+
+def compute_region_columns(data, regions, rolling, backend):
+
+    days = int(rolling / timedelta(days=1))
+    codes = pd.Categorical(regions)
+    groups = codes.codes.astype(np.int64)
+    skipped = groups < 0
+
+    pop = np.array(
+        [population(region) for region in codes.categories], dtype=float
+    )
+    pop = np.where(skipped, np.nan, pop[groups])
+
+    columns = dict()
+    for name in ("cases", "deaths"):
+        diff, avg = backend.series(
+            groups, data[name].values.astype(float), days
+        )
+        diff[skipped] = np.nan
+        avg[skipped] = np.nan
+        columns[f"diff_{name}"] = diff
+        columns[f"avg_{name}"] = avg
+
+    avg_dates = (data["date"] - rolling / 2).where(~skipped)
+
+    data["diff_cases"] = columns["diff_cases"]
+    data["diff_deaths"] = columns["diff_deaths"]
+    data["diff_cases_pc"] = columns["diff_cases"] / pop * 100000
+    data["diff_deaths_pc"] = columns["diff_deaths"] / pop * 100000
+    data["avg_dates"] = avg_dates
+    data["avg_cases"] = columns["avg_cases"]
+    data["avg_deaths"] = columns["avg_deaths"]
+    data["avg_cases_pc"] = columns["avg_cases"] / pop * 100000
+    data["avg_deaths_pc"] = columns["avg_deaths"] / pop * 100000
+
+
+def compute_states_data(backend=None):
+
+    GH_STATES_DATA.sort_values("date", inplace=True)
+
+    compute_region_columns(
+        GH_STATES_DATA,
+        GH_STATES_DATA["state"].values,
+        ROLLING,
+        compute_backend(backend),
+    )
 
-        pop = population(f"{state}, {county}")
 
-        avg_dates = subset["date"] - ROLLING / 2
-        diff_cases = subset["cases"].diff()
-        diff_deaths = subset["deaths"].diff()
-        avg_cases = subset["cases"].diff().rolling(ROLLING_DAYS).mean()
-        avg_deaths = subset["deaths"].diff().rolling(ROLLING_DAYS).mean()
+def compute_counties_data(backend=None):
+
+    GH_COUNTIES_DATA.sort_values("date", inplace=True)
 
-        diff_cases_pc = diff_cases / pop * 100000
-        diff_deaths_pc = diff_deaths / pop * 100000
-        avg_cases_pc = avg_cases / pop * 100000
-        avg_deaths_pc = avg_deaths / pop * 100000
+    regions = (
+        GH_COUNTIES_DATA["state"] + ", " + GH_COUNTIES_DATA["county"]
+    ).where(GH_COUNTIES_DATA["county"].str.lower() != "unknown")
 
-        GH_COUNTIES_DATA.loc[subset.index, "diff_cases"] = diff_cases
-        GH_COUNTIES_DATA.loc[subset.index, "diff_deaths"] = diff_deaths
-        GH_COUNTIES_DATA.loc[subset.index, "diff_cases_pc"] = diff_cases_pc
-        GH_COUNTIES_DATA.loc[subset.index, "diff_deaths_pc"] = diff_deaths_pc
-        GH_COUNTIES_DATA.loc[subset.index, "avg_dates"] = avg_dates
-        GH_COUNTIES_DATA.loc[subset.index, "avg_cases"] = avg_cases
-        GH_COUNTIES_DATA.loc[subset.index, "avg_deaths"] = avg_deaths
-        GH_COUNTIES_DATA.loc[subset.index, "avg_cases_pc"] = avg_cases_pc
-        GH_COUNTIES_DATA.loc[subset.index, "avg_deaths_pc"] = avg_deaths_pc
+    compute_region_columns(
+        GH_COUNTIES_DATA, regions.values, ROLLING, compute_backend(backend)
+    )
 
 
-def compute_nnl_data():
+def compute_nnl_data(backend=None):
 
     global NNL_DATA
 
-    site_names = {
-        "nnl-bettis": "NNL Bettis",
-        "nnl-knolls": "NNL Knolls",
-        "nnl-ks": "NNL Kesselring",
-        "nnl-nptu": "NNL NPTU-Charleston",
-        "nnl-nrf": "NNL NRF",
-        "nnl-ls": "NNL Liberty Street",
-        "non-nnl-bettis": "Non-NNL Bettis",
-        "non-nnl-knolls": "Non-NNL Knolls",
-        "non-nnl-ks": "Non-NNL Kesselring",
-        "non-nnl-nptu": "Non-NNL NPTU-Charleston",
-        "non-nnl-nrf": "Non-NNL NRF",
-        "non-nnl-ls": "Non-NNL Liberty Street",
-    }
+    site_names = dict(zip(NNL_SITES["column"], NNL_SITES["name"]))
 
     idx = pd.date_range(NNL_DATA["date"].min(), NNL_DATA["date"].max())
     NNL_DATA.sort_values("date", inplace=True)
     NNL_DATA.index = pd.DatetimeIndex(NNL_DATA["date"])
     NNL_DATA = NNL_DATA.reindex(idx, method="pad")
 
-    NNL_DATA["date"] = NNL_DATA.index
-    NNL_DATA.index = pd.RangeIndex(len(NNL_DATA))
-
-    data = {"date": [], "site": [], "cases": []}
-    for index, irow in tqdm(NNL_DATA.iterrows()):
-        for site in NNL_DATA.columns[1:]:
-            data["date"].append(irow["date"])
-            data["site"].append(site_names[site])
-            data["cases"].append(irow[site])
-    NNL_DATA = pd.DataFrame(data)
-
-    NNL_DATA.sort_values("date", inplace=True)
-    for site in tqdm(NNL_DATA["site"].unique()):
+    cases = NNL_DATA.loc[:, list(site_names)].rename(columns=site_names)
+    cases.columns.name = "site"
+    cases.index.name = "date"
 
-        slicer = NNL_DATA["site"] == site
-        subset = NNL_DATA.loc[slicer, :]
+    pop = pd.Series(NNL_POP)[cases.columns]
 
-        pop = population(site)
+    groups = np.repeat(np.arange(cases.shape[1]), cases.shape[0])
+    diff, avg = compute_backend(backend).series(
+        groups, cases.values.T.astype(float).ravel(), NNL_ROLLING_DAYS
+    )
+    diff_cases = pd.DataFrame(
+        diff.reshape(cases.shape[::-1]).T, cases.index, cases.columns
+    )
+    avg_cases = pd.DataFrame(
+        avg.reshape(cases.shape[::-1]).T, cases.index, cases.columns
+    )
 
-        avg_dates = subset["date"] - NNL_ROLLING / 2
-        diff_cases = subset["cases"].diff()
-        avg_cases = subset["cases"].diff().rolling(NNL_ROLLING_DAYS).mean()
-        diff_cases_pc = diff_cases / pop * 100000
-        avg_cases_pc = avg_cases / pop * 100000
+    NNL_DATA = pd.concat(
+        {
+            "cases": cases,
+            "diff_cases": diff_cases,
+            "diff_cases_pc": diff_cases / pop * 100000,
+            "avg_cases": avg_cases,
+            "avg_cases_pc": avg_cases / pop * 100000,
+        },
+        axis=1,
+    ).stack("site")
+    NNL_DATA.reset_index(inplace=True)
 
-        NNL_DATA.loc[subset.index, "diff_cases"] = diff_cases
-        NNL_DATA.loc[subset.index, "diff_cases_pc"] = diff_cases_pc
-        NNL_DATA.loc[subset.index, "avg_dates"] = avg_dates
-        NNL_DATA.loc[subset.index, "avg_cases"] = avg_cases
-        NNL_DATA.loc[subset.index, "avg_cases_pc"] = avg_cases_pc
+    NNL_DATA["avg_dates"] = NNL_DATA["date"] - NNL_ROLLING / 2
 
 
 def format_region_name(region):
@@ -392,14 +684,6 @@ def parse_detailed_name(name):
     return state, county
 
 
-def get_pop_entry(region):
-
-    region = format_region_name(region)
-    entry = POP_DATA[POP_DATA["NAME"] == region]
-
-    return entry
-
-
 def population(region):
 
     if region == "Missouri, Joplin":
@@ -408,14 +692,12 @@ def population(region):
     if region == "Missouri, Kansas City":
         return 491918
 
-    if "NNL" in region:
+    if region in NNL_POP:
         return NNL_POP[region]
 
-    entry = get_pop_entry(region)
-
     try:
-        return int(entry.values[0][2])
-    except IndexError:
+        return int(POP_LOOKUP[format_region_name(region)])
+    except KeyError:
         raise Exception(f"Unable to find population of {region}!")
 
 
@@ -453,1106 +735,4216 @@ def compute_log_palette(palette, low, high, value):
     return palette[key]
 
 
-def get_dataset(region):
+def douglas_peucker(lons, lats):
 
-    if "NNL" in region:
-        return NNL_DATA[NNL_DATA["site"] == region]
+    points = np.column_stack((lons, lats))
+    importance = np.zeros(len(points))
+    importance[0] = importance[-1] = np.inf
 
-    pop_entry = get_pop_entry(region)
+    stack = [(0, len(points) - 1, np.inf)]
+    while stack:
+        start, end, limit = stack.pop()
+        if end - start < 2:
+            continue
 
-    if pop_entry["GEO_ID"].values[0].startswith("04"):
-        data = GH_STATES_DATA[GH_STATES_DATA["state"] == region]
-
-    elif pop_entry["GEO_ID"].values[0].startswith("05"):
-        state, county = region.split(", ")
-        data = GH_COUNTIES_DATA[
-            (GH_COUNTIES_DATA["state"] == state).values
-            & (GH_COUNTIES_DATA["county"] == county).values
-        ]
+        inner = points[start + 1 : end]
+        seg = points[end] - points[start]
+        rel = inner - points[start]
+        norm = np.hypot(*seg)
+        if norm > 0:
+            dist = np.abs(seg[0] * rel[:, 1] - seg[1] * rel[:, 0]) / norm
+        else:
+            dist = np.hypot(rel[:, 0], rel[:, 1])
 
-    return data
+        key = int(np.argmax(dist))
+        value = min(dist[key], limit)
+        importance[start + 1 + key] = value
 
+        stack.append((start, start + 1 + key, value))
+        stack.append((start + 1 + key, end, value))
 
-def get_data(region, per_capita=False, data_type="cases", constant_date=None):
+    return importance
 
-    data = dict()
-    test_data = None
-    tot_positive = None
-    tot_testing = None
 
-    if data_type in ("cases", "deaths"):
+def split_rings(lons, lats):
 
-        subset = get_dataset(region)
+    lons = np.asarray(lons, dtype=float)
+    lats = np.asarray(lats, dtype=float)
 
-        dates = subset["date"]
-        avg_dates = subset["avg_dates"]
+    breaks = np.flatnonzero(np.isnan(lons))
+    bounds = zip(np.r_[0, breaks + 1], np.r_[breaks, len(lons)])
 
-        if not per_capita:
-            dt_label = data_type
-            label = f"Total New {data_type.title()}"
-        else:
-            dt_label = f"{data_type}_pc"
-            label = f"New {data_type.title()} per 100,000"
+    rings = []
+    for start, end in bounds:
+        ring_lons, ring_lats = lons[start:end], lats[start:end]
+        if len(ring_lons) > 1 and (
+            ring_lons[0] == ring_lons[-1] and ring_lats[0] == ring_lats[-1]
+        ):
+            ring_lons, ring_lats = ring_lons[:-1], ring_lats[:-1]
+        if len(ring_lons) > 0:
+            rings.append((ring_lons, ring_lats))
 
-        data = subset[f"diff_{dt_label}"]
-        avg_data = subset[f"avg_{dt_label}"]
+    return rings
 
-    elif data_type in (
-        "testing",
-        "positivity",
-        "constant positivity",
-        "constant testing",
-    ):
 
-        subset = TRACKING_DATA[
-            TRACKING_DATA["state"] == STATE_ABBRV[region]
-        ].sort_values("date")
+def simplify_geometry(shapes, tolerances=GEOMETRY_TOLERANCES):
 
-        date_offset = np.timedelta64(3, "D") + np.timedelta64(12, "h")
+    from tqdm import tqdm
 
-        dates = subset["datetime"]
-        avg_dates = dates - date_offset
+    rings = [split_rings(lons, lats) for lons, lats in shapes]
 
-        if data_type == "positivity":
-            data = subset["positivity"]
-            tot_positive = subset["positive"] * 100
-            tot_testing = subset["totalTestResults"]
-            label = "Positivity (%)"
-        elif data_type == "testing":
-            data = subset["totalTestResultsIncrease"]
-            label = "Total Tests"
-        elif data_type == "constant positivity":
-            positivity = subset[subset["datetime"] == constant_date][
-                "positivity"
-            ].values
-            data = subset["positiveIncrease"]
-            test_data = (
-                (subset["totalTestResults"] * positivity / 100)
-                .diff()
-                .rolling(7)
-                .mean()
-            )
-            label = "Cases"
-        elif data_type == "constant testing":
-            total_tests = subset[subset["datetime"] == constant_date][
-                "totalTestResultsIncrease"
-            ].values
-            data = subset["positiveIncrease"]
-            test_data = (
-                (subset["positivity"] * total_tests / 100).rolling(7).mean()
-            )
-            label = "Cases"
+    def vertex_keys(ring):
+        return list(zip(np.round(ring[0], 6), np.round(ring[1], 6)))
 
-        if data_type != "positivity" and per_capita:
-            pop = population(region)
-            data = data / pop * 100000
+    neighbors = dict()
+    for shape in rings:
+        for ring in shape:
+            keys = vertex_keys(ring)
+            for i, key in enumerate(keys):
+                adjacent = neighbors.setdefault(key, set())
+                adjacent.add(keys[i - 1])
+                adjacent.add(keys[(i + 1) % len(keys)])
 
-        avg_data = data.rolling(7).mean()
+    arcs = dict()
 
-        if data_type not in ("positivity", "testing"):
-            if per_capita:
-                label = f"New {label.title()} per 100,000"
+    def simplify_arc(keys, lons, lats):
+        reverse = keys[::-1] < keys
+        canonical = tuple(keys[::-1] if reverse else keys)
+        if canonical not in arcs:
+            if reverse:
+                arcs[canonical] = douglas_peucker(lons[::-1], lats[::-1])
             else:
-                label = f"Total New {label.title()}"
+                arcs[canonical] = douglas_peucker(lons, lats)
+        importance = arcs[canonical]
+        return importance[::-1] if reverse else importance
 
-    return (
-        dates,
-        avg_dates,
-        data,
-        avg_data,
-        test_data,
-        label,
-        tot_positive,
-        tot_testing,
-    )
+    levels = [([], []) for _ in tolerances]
+    for shape in tqdm(rings):
 
+        simplified = [([], []) for _ in tolerances]
+        for ring in shape:
 
-class StateDisplay:
-    def __init__(self, dataset=STATES):
+            keys = vertex_keys(ring)
+            junctions = [
+                i for i, key in enumerate(keys) if len(neighbors[key]) > 2
+            ]
 
-        self.dataset = dataset
+            if not junctions:
+                junctions = sorted(
+                    {keys.index(min(keys)), keys.index(max(keys))}
+                )
 
-        self.state_selection = MultiSelect(
-            title="States:",
-            options=self.dataset,
-            value=["New York", "Texas"],
-            sizing_mode="stretch_both",
-        )
-        self.per_capita = RadioGroup(
-            labels=["Total", "Per Capita"],
-            active=0,
-            sizing_mode="stretch_width",
-        )
-        self.data_getter = RadioGroup(
-            labels=[
-                "Cases",
-                "Deaths",
-                "Positivity",
-                "Testing",
-                "Constant Positivity",
-                "Constant Testing",
-            ],
-            active=0,
-            sizing_mode="stretch_width",
-        )
-        self.plot_type = RadioGroup(
-            labels=["Linear", "Logarithmic"],
-            active=0,
-            sizing_mode="stretch_width",
-        )
+            order = np.roll(np.arange(len(keys)), -junctions[0])
+            order = np.r_[order, order[0]]
+            cuts = sorted((i - junctions[0]) % len(keys) for i in junctions)
+            cuts.append(len(keys))
 
-        self.constant_date = DatePicker(
-            title="Constant Date",
-            value=(datetime.today() - timedelta(days=1)).date(),
-            sizing_mode="stretch_width",
-        )
+            importance = np.empty(len(order))
+            for start, end in zip(cuts[:-1], cuts[1:]):
+                idx = order[start : end + 1]
+                importance[start : end + 1] = simplify_arc(
+                    [keys[i] for i in idx], ring[0][idx], ring[1][idx]
+                )
 
-        self.show_total = CheckboxGroup(
-            labels=["Show total"], sizing_mode="stretch_width",
-        )
+            for level, tolerance in enumerate(tolerances):
+                keep = order[importance > tolerance] if tolerance else order
+                if simplified[level][0]:
+                    simplified[level][0].append([np.nan])
+                    simplified[level][1].append([np.nan])
+                simplified[level][0].append(ring[0][keep])
+                simplified[level][1].append(ring[1][keep])
 
-        self.total_only = CheckboxGroup(
-            labels=["Total only"], sizing_mode="stretch_width",
-        )
+        for level in range(len(tolerances)):
+            lons, lats = simplified[level]
+            levels[level][0].append(np.concatenate(lons) if lons else [])
+            levels[level][1].append(np.concatenate(lats) if lats else [])
 
-        self.src = None
-        self.p = None
-        self.logp = None
+    return levels
 
-        self.tooltips = [("State", "@state")]
 
-    def make_dataset(self, state_list):
+def read_state_shapes():
 
-        by_state = {
-            "avg_date": [],
-            "avg_data": [],
-            "state": [],
-            "color": [],
-            "line-width": [],
-        }
+    from bokeh.sampledata.us_states import data
 
-        color_cycle = cycle(Category20_20)
-        palette = [next(color_cycle) for _ in self.dataset]
+    states = {
+        code: state for code, state in data.items() if code not in ("HI", "AK")
+    }
 
-        show_total = self.show_total.active == [0]
-        total_only = self.total_only.active == [0]
+    return {
+        "names": [state["name"] for state in states.values()],
+        "codes": list(states),
+        "shapes": [
+            (state["lons"], state["lats"]) for state in states.values()
+        ],
+    }
 
-        totals = None
-        totals_denom = None
 
-        for state_name in state_list:
+def read_county_shapes():
 
-            per_capita = self.per_capita.active == 1
-            data_getter = self.data_getter.labels[
-                self.data_getter.active
-            ].lower()
-            constant_date = self.constant_date.value
+    from bokeh.sampledata.us_counties import data
 
-            (
-                dates,
-                avg_dates,
-                data,
-                avg_data,
-                test_data,
-                label,
-                tot_positive,
-                tot_testing,
-            ) = get_data(state_name, per_capita, data_getter, constant_date)
+    excluded = ("ak", "hi", "pr", "gu", "vi", "mp", "as")
+    counties = [
+        county for county in data.values() if county["state"] not in excluded
+    ]
 
-            if tot_positive is None and tot_testing is None:
-                subtotal = pd.Series(avg_data.values[7:])
-                subtotal.index = pd.DatetimeIndex(avg_dates.values[7:])
-                subtotal_denom = None
-            else:
-                subtotal = pd.Series(tot_positive.values[7:])
-                subtotal.index = pd.DatetimeIndex(avg_dates.values[7:])
-                subtotal_denom = pd.Series(tot_testing.values[7:])
-                subtotal_denom.index = pd.DatetimeIndex(avg_dates.values[7:])
-
-            idx = pd.date_range(subtotal.index.min(), subtotal.index.max())
-            subtotal = subtotal.reindex(idx)
-            subtotal.interpolate(method="time", inplace=True)
-            if subtotal_denom is not None:
-                subtotal_denom = subtotal_denom.reindex(idx)
-                subtotal_denom.interpolate(method="time", inplace=True)
-
-            if totals is None:
-                totals = subtotal
-                if subtotal_denom is not None:
-                    totals_denom = subtotal_denom
-            else:
-                idx = pd.date_range(
-                    min(subtotal.index.min(), totals.index.min()),
-                    max(subtotal.index.max(), totals.index.max()),
-                )
-                totals = totals.reindex(idx, fill_value=0)
-                subtotal = subtotal.reindex(idx, fill_value=0)
-                totals += subtotal
-                if subtotal_denom is not None:
-                    totals_denom = totals_denom.reindex(idx, fill_value=0)
-                    subtotal_denom = subtotal_denom.reindex(idx, fill_value=0)
-                    totals_denom += subtotal_denom
+    return {
+        "names": [county["detailed name"] for county in counties],
+        "codes": [county["state"] for county in counties],
+        "shapes": [(county["lons"], county["lats"]) for county in counties],
+    }
 
-            if len(state_list) == 1 or not show_total or not total_only:
-                by_state["avg_date"].append(avg_dates.values)
-                by_state["avg_data"].append(avg_data.values)
 
-                by_state["state"].append(state_name)
-                by_state["color"].append(
-                    palette[self.dataset.index(state_name)]
-                )
-                by_state["line-width"].append(1)
+def load_geometry(name, read_shapes, tolerances=GEOMETRY_TOLERANCES):
 
-        if totals_denom is not None:
-            totals /= totals_denom
+    filename = f"{name}-geometry.pkl"
 
-        if show_total:
-            by_state["avg_date"].append(totals.index.values)
-            by_state["avg_data"].append(totals.values)
-            by_state["state"].append("Total")
-            by_state["color"].append("black")
-            by_state["line-width"].append(2)
+    if os.path.exists(filename):
+        with open(filename, "rb") as fileobj:
+            cached = pickle.load(fileobj)
+        if cached.get("tolerances") == tolerances and "names" in cached:
+            return cached
 
-        return label, ColumnDataSource(by_state)
+    shapes = read_shapes()
 
-    def make_plot(self):
+    geometry = {
+        "tolerances": tolerances,
+        "names": shapes["names"],
+        "codes": shapes["codes"],
+        "levels": simplify_geometry(shapes["shapes"], tolerances),
+    }
 
-        self.p = figure(
-            x_axis_label="Date",
-            x_axis_type="datetime",
-            y_axis_label="Total Cases",
-            width=900,
-        )
+    with open(filename, "wb") as fileobj:
+        pickle.dump(geometry, fileobj)
 
-        self.p.multi_line(
-            source=self.src,
-            xs="avg_date",
-            ys="avg_data",
-            legend_field="state",
-            color="color",
-            line_width="line-width",
-        )
+    return geometry
 
-        self.p.add_tools(HoverTool(tooltips=self.tooltips))
 
-        self.p.legend.location = "top_left"
+def shape_adjacency(shapes, radius=ADJACENCY_RADIUS):
 
-        self.logp = figure(
-            x_axis_label="Date",
-            x_axis_type="datetime",
-            y_axis_label="Total Cases",
-            y_axis_type="log",
-            width=900,
-        )
+    from scipy.spatial import cKDTree
 
-        self.logp.multi_line(
-            source=self.src,
-            xs="avg_date",
-            ys="avg_data",
-            legend_field="state",
-            color="color",
-            line_width="line-width",
+    points = []
+    owners = []
+    for i, (lons, lats) in enumerate(shapes):
+        ring = np.column_stack(
+            [np.asarray(lons, dtype=float), np.asarray(lats, dtype=float)]
         )
+        ring = ring[~np.isnan(ring).any(axis=1)]
+        points.append(ring)
+        owners.append(np.full(len(ring), i))
 
-        self.logp.add_tools(HoverTool(tooltips=self.tooltips))
-
-        self.logp.legend.location = "top_left"
+    points = np.concatenate(points)
+    owners = np.concatenate(owners)
 
-    def update_data(self, label, src):
+    pairs = owners[cKDTree(points).query_pairs(radius, output_type="ndarray")]
+    pairs = np.sort(pairs[pairs[:, 0] != pairs[:, 1]], axis=1)
 
-        if self.src is None:
-            self.src = src
-            self.make_plot()
-        else:
-            self.src.data.update(src.data)
+    return np.unique(pairs, axis=0)
 
-        if self.plot_type.active == 0:
-            self.p.visible = True
-            self.logp.visible = False
-        else:
-            self.p.visible = False
-            self.logp.visible = True
 
-        self.p.yaxis.axis_label = label
-        self.logp.yaxis.axis_label = label
+def load_adjacency(name, read_shapes, radius=ADJACENCY_RADIUS):
 
-        if len(self.data_getter.labels) == 1:
-            self.data_getter.visible = False
+    filename = f"{name}-adjacency.pkl"
 
-        data_getter = self.data_getter.labels[self.data_getter.active].lower()
-        self.constant_date.visible = data_getter in (
-            "constant positivity",
-            "constant testing",
-        )
+    if os.path.exists(filename):
+        with open(filename, "rb") as fileobj:
+            cached = pickle.load(fileobj)
+        if cached.get("radius") == radius:
+            return cached
 
-    def update(self, attr, old, new):
+    shapes = read_shapes()
 
-        states_to_plot = sorted(self.state_selection.value)
+    adjacency = {
+        "radius": radius,
+        "names": shapes["names"],
+        "edges": shape_adjacency(shapes["shapes"], radius),
+    }
 
-        label, new_src = self.make_dataset(states_to_plot)
+    with open(filename, "wb") as fileobj:
+        pickle.dump(adjacency, fileobj)
 
-        self.update_data(label, new_src)
+    return adjacency
 
-        self.show_total.visible = len(states_to_plot) != 1
-        self.total_only.visible = self.show_total.active == [0]
 
-    def run(self):
+def select_geometry_level(span, width, tolerances=GEOMETRY_TOLERANCES):
 
-        self.state_selection.on_change("value", self.update)
+    if span is None or not width:
+        return len(tolerances) - 1
 
-        self.per_capita.on_change("active", self.update)
-        self.data_getter.on_change("active", self.update)
-        self.plot_type.on_change("active", self.update)
-        self.constant_date.on_change("value", self.update)
-        self.show_total.on_change("active", self.update)
-        self.total_only.on_change("active", self.update)
+    resolution = span / width
 
-        controls = column(
-            [
-                self.state_selection,
-                self.per_capita,
-                self.data_getter,
-                self.plot_type,
-                self.constant_date,
-                self.show_total,
-                self.total_only,
-            ],
-            sizing_mode="fixed",
-            width=300,
-            height=600,
-        )
+    return max(
+        level
+        for level, tolerance in enumerate(tolerances)
+        if tolerance <= resolution
+    )
 
-        self.update(None, None, None)
 
-        plots = column(self.p, self.logp)
+class RegionStore:
+    def __init__(self, regions, dates, columns, present):
 
-        return row(controls, plots, sizing_mode="stretch_both")
+        self.regions = list(regions)
+        self.index = {region: i for i, region in enumerate(self.regions)}
+        self.dates = pd.DatetimeIndex(dates)
+        self.columns = columns
+        self.present = present
 
+        self.populations = None
+        self.kinds = None
 
-class SingleStateDisplay(StateDisplay):
-    def __init__(self):
+        self.totals = set()
+        self.ratios = dict()
 
-        super().__init__()
+        self.sums = dict()
+        self.cache = dict()
 
-        self.state = "New York"
-        self.menu = STATES
+    @classmethod
+    def from_frame(cls, frame, region_column, date_column, value_columns):
 
-        self.state_selection = Dropdown(
-            menu=self.menu, label=self.state, sizing_mode="stretch_width"
+        regions = pd.Categorical(frame[region_column])
+        dates = pd.date_range(
+            frame[date_column].min(), frame[date_column].max()
         )
 
-    def make_dataset(self, state_name=""):
+        rows = regions.codes
+        cols = (frame[date_column] - dates[0]).dt.days.values
 
-        per_capita = self.per_capita.active == 1
-        data_getter = self.data_getter.labels[self.data_getter.active].lower()
-        constant_date = self.constant_date.value
+        shape = (len(regions.categories), len(dates))
 
-        (
-            dates,
-            avg_dates,
-            data,
-            avg_data,
-            test_data,
-            label,
-            tot_positive,
-            tot_testing,
-        ) = get_data(state_name, per_capita, data_getter, constant_date)
+        present = np.zeros(shape, dtype=bool)
+        present[rows, cols] = True
 
-        data_dict = {
-            "date": dates.values,
-            "avg_date": avg_dates.values,
-            "data": data.values,
-            "avg_data": avg_data.values,
+        columns = dict()
+        for name in value_columns:
+            columns[name] = np.full(shape, np.nan)
+            columns[name][rows, cols] = frame[name].values
+
+        return cls(regions.categories, dates, columns, present)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __setitem__(self, name, values):
+        self.columns[name] = values
+        self.sums.pop(name, None)
+        self.cache = {
+            key: value for key, value in self.cache.items() if key[0] != name
         }
 
-        if test_data is None:
-            data_dict["test_data"] = np.empty_like(data.values, dtype=float)
-            data_dict["test_data"][:] = np.NaN
-        else:
-            data_dict["test_data"] = test_data.values
+    def row(self, region):
+        return self.index[region]
 
-        return label, ColumnDataSource(data_dict)
+    def position(self, value):
 
-    def make_plot(self):
+        if value is None:
+            return None
 
-        self.p = figure(
-            x_axis_label="Date",
-            x_axis_type="datetime",
-            y_axis_label="Total Cases",
-            width=900,
-        )
+        offset = (pd.Timestamp(value) - self.dates[0]).days
+        if 0 <= offset < len(self.dates):
+            return offset
 
-        self.p.vbar(source=self.src, x="date", top="data", color="orange")
-        self.p.line(source=self.src, x="avg_date", y="avg_data", line_width=2)
-        self.p.line(
-            source=self.src,
-            x="date",
-            y="test_data",
-            line_width=2,
-            line_dash="dashed",
-        )
+        return None
 
-        self.p.legend.visible = False
+    def cumulative(self, name):
 
-        self.logp = figure(
-            x_axis_label="Date",
-            x_axis_type="datetime",
-            y_axis_label="Total Cases",
-            y_axis_type="log",
-            width=900,
-        )
+        if name not in self.sums:
+            values = self.columns[name]
+            valid = ~np.isnan(values)
 
-        self.logp.vbar(
-            source=self.src, x="date", bottom=1e-10, top="data", color="orange"
-        )
-        self.logp.line(
-            source=self.src, x="avg_date", y="avg_data", line_width=2
-        )
-        self.logp.line(
-            source=self.src,
-            x="date",
-            y="test_data",
-            line_width=2,
-            line_dash="dashed",
-        )
+            total = np.zeros((values.shape[0], values.shape[1] + 1))
+            count = np.zeros((values.shape[0], values.shape[1] + 1))
+            np.cumsum(np.where(valid, values, 0), axis=1, out=total[:, 1:])
+            np.cumsum(valid, axis=1, out=count[:, 1:])
 
-        self.logp.legend.visible = False
+            self.sums[name] = (total, count)
 
-    def update(self, attr, old, new):
+        return self.sums[name]
 
-        label, new_src = self.make_dataset(self.state)
+    def rolling(self, name, window):
 
-        self.update_data(label, new_src)
+        key = (name, window)
 
-        self.p.title.text = self.state
+        if key not in self.cache:
+            total, count = self.cumulative(name)
 
-    def update_selection(self, event):
-        self.state = event.item
-        self.state_selection.label = self.state
-        self.update(None, None, None)
+            result = np.full(self.columns[name].shape, np.nan)
+            window_total = total[:, window:] - total[:, :-window]
+            window_count = count[:, window:] - count[:, :-window]
+            result[:, window - 1 :] = np.where(
+                window_count == window, window_total / window, np.nan
+            )
 
-    def run(self):
+            self.cache[key] = result
 
-        self.state_selection.on_click(self.update_selection)
-        self.per_capita.on_change("active", self.update)
-        self.data_getter.on_change("active", self.update)
-        self.plot_type.on_change("active", self.update)
-        self.constant_date.on_change("value", self.update)
+        return self.cache[key]
 
-        controls = column(
-            [
-                self.state_selection,
-                self.per_capita,
-                self.data_getter,
-                self.plot_type,
-                self.constant_date,
-            ],
-            sizing_mode="fixed",
-            width=300,
-            height=600,
-        )
+    def window_average(self, name, window, rows=slice(None)):
 
-        self.update_selection(MenuItemClick(None, self.state))
+        values = self.columns[name][rows]
 
-        plots = column(self.p, self.logp)
+        result = np.full(values.shape, np.nan)
+        result[..., window:] = (
+            values[..., window:] - values[..., :-window]
+        ) / window
 
-        return row(controls, plots, sizing_mode="stretch_both")
+        return result
 
+    def average_at(self, name, window, col):
 
-class SingleCountyDisplay(SingleStateDisplay):
-    def __init__(self):
+        if col is None or col < window:
+            return np.full(len(self.regions), np.nan)
 
-        super().__init__()
+        values = self.columns[name]
 
-        self.state = "New York, Washington"
-        self.menu = COUNTIES
+        return (values[:, col] - values[:, col - window]) / window
 
-        self.state_selection = Dropdown(
-            menu=self.menu, label=self.state, sizing_mode="stretch_width"
-        )
+    def fill_gaps(self, name):
 
-        self.data_getter = RadioGroup(
-            labels=[
-                "Cases",
-                "Deaths",
-            ],
-            active=0,
-            sizing_mode="stretch_width",
-        )
+        values = pd.DataFrame(self.columns[name].T).ffill().values.T
 
+        last = self.present.shape[1] - 1 - self.present[:, ::-1].argmax(axis=1)
+        values[np.arange(values.shape[1]) > last[:, None]] = np.nan
 
-class RatioDisplay(SingleStateDisplay):
-    def make_dataset(self, state_name=""):
+        self[name] = values
 
-        subset = GH_STATES_DATA.loc[
-            GH_STATES_DATA["state"] == state_name,
-            ("avg_dates", "avg_cases", "avg_deaths"),
-        ]
+    def filled(self, name):
 
-        data_dict = {
-            "date": subset["avg_dates"].values,
-            "cases": subset["avg_cases"].values,
-            "deaths": subset["avg_deaths"].values,
-            "ratio": subset["avg_deaths"].values / subset["avg_cases"].values,
+        key = (name, "filled")
+
+        if key not in self.cache:
+            values = self.columns[name]
+            if name in self.totals:
+                values = pd.DataFrame(values.T).ffill().values.T
+            self.cache[key] = np.nan_to_num(values)
+
+        return self.cache[key]
+
+    def membership(self, groups, aliases=None):
+
+        from scipy import sparse
+
+        if aliases is None:
+            aliases = dict()
+
+        rows = []
+        cols = []
+        for i, members in enumerate(groups.values()):
+            for member in dict.fromkeys(members):
+                member = aliases.get(member, member)
+                if member in self.index:
+                    rows.append(i)
+                    cols.append(self.index[member])
+
+        return sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, cols)),
+            shape=(len(groups), len(self.regions)),
+        )
+
+    def aggregate(self, groups, aliases=None):
+
+        membership = self.membership(groups, aliases)
+
+        columns = {
+            name: membership @ self.filled(name)
+            for name in self.columns
+            if name not in self.ratios
         }
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for name, (numerator, denominator, scale) in self.ratios.items():
+                columns[name] = (
+                    columns[numerator] / columns[denominator] * scale
+                )
 
-        return "Total Cases and Deaths", ColumnDataSource(data_dict)
+        present = membership @ self.present.astype(float) > 0
 
-    def make_plot(self):
+        store = RegionStore(groups, self.dates, columns, present)
+        store.totals = self.totals
+        store.ratios = self.ratios
 
-        self.p = figure(
-            x_axis_label="Date",
-            x_axis_type="datetime",
-            y_axis_label="Total Cases and Deaths",
-            width=900,
+        if self.populations is not None:
+            store.populations = membership @ np.nan_to_num(self.populations)
+
+        if self.kinds is not None:
+            first = np.asarray(membership.argmax(axis=1)).ravel()
+            store.kinds = np.array(
+                [f"{kind} group" for kind in self.kinds[first]], dtype=object
+            )
+
+        return store
+
+    def extend(self, other):
+
+        store = RegionStore(
+            self.regions + other.regions,
+            self.dates,
+            {
+                name: np.vstack([values, other.columns[name]])
+                for name, values in self.columns.items()
+            },
+            np.vstack([self.present, other.present]),
         )
+        store.totals = self.totals
+        store.ratios = self.ratios
 
-        self.p.extra_y_ranges = {"ratio_axis": Range1d()}
+        if self.populations is not None:
+            store.populations = np.concatenate(
+                [self.populations, other.populations]
+            )
 
-        axis = LinearAxis(y_range_name="ratio_axis")
-        axis.formatter = NumeralTickFormatter(format="0 %")
-        self.p.add_layout(axis, "right")
+        if self.kinds is not None:
+            store.kinds = np.concatenate([self.kinds, other.kinds])
+
+        return store
+
+    def save(self, directory, name):
+
+        arrays = dict(self.columns)
+        arrays["present"] = self.present
+        for column in self.columns:
+            if column not in self.ratios:
+                arrays[f"filled-{column}"] = self.filled(column)
+        if self.populations is not None:
+            arrays["populations"] = self.populations
+
+        trends = [key for key in self.cache if key[1] == "trend"]
+        for key in trends:
+            for part, values in self.cache[key].items():
+                arrays["-".join(map(str, key + (part,)))] = values
+
+        for key, values in arrays.items():
+            np.save(os.path.join(directory, f"{name}-{key}.npy"), values)
+
+        with open(os.path.join(directory, f"{name}.pkl"), "wb") as fileobj:
+            pickle.dump(
+                {
+                    "regions": self.regions,
+                    "dates": self.dates,
+                    "columns": list(self.columns),
+                    "kinds": self.kinds,
+                    "totals": self.totals,
+                    "ratios": self.ratios,
+                    "populations": self.populations is not None,
+                    "trends": trends,
+                },
+                fileobj,
+            )
 
-        colors = Category20_3
+    @classmethod
+    def attach(cls, directory, name):
 
-        self.p.line(
+        def load(key):
+            return np.load(
+                os.path.join(directory, f"{name}-{key}.npy"), mmap_mode="r"
+            )
+
+        with open(os.path.join(directory, f"{name}.pkl"), "rb") as fileobj:
+            meta = pickle.load(fileobj)
+
+        store = cls(
+            meta["regions"],
+            meta["dates"],
+            {column: load(column) for column in meta["columns"]},
+            load("present"),
+        )
+        store.kinds = meta["kinds"]
+        store.totals = meta["totals"]
+        store.ratios = meta["ratios"]
+
+        if meta["populations"]:
+            store.populations = load("populations")
+
+        for column in meta["columns"]:
+            if column not in store.ratios:
+                store.cache[(column, "filled")] = load(f"filled-{column}")
+
+        for key in meta.get("trends", []):
+            store.cache[key] = {
+                part: load("-".join(map(str, key + (part,))))
+                for part in ("level", "rate", "spread")
+            }
+
+        return store
+
+    def shared_bytes(self):
+
+        arrays = [self.present, *self.columns.values()]
+        for values in self.cache.values():
+            if isinstance(values, dict):
+                arrays.extend(values.values())
+            else:
+                arrays.append(values)
+
+        return sum(
+            values.nbytes for values in arrays if isinstance(values, np.memmap)
+        )
+
+    def trend(self, name, window, span=GROWTH_DAYS):
+
+        key = (name, "trend", window, span)
+
+        if key not in self.cache:
+            averages = self.window_average(name, window)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                logs = np.log(averages)
+            valid = np.isfinite(logs)
+
+            days = np.arange(logs.shape[1], dtype=float)
+            logs = np.where(valid, logs, 0)
+
+            sums = []
+            for values in (valid, logs, logs * days, logs**2):
+                total = np.zeros((values.shape[0], values.shape[1] + 1))
+                np.cumsum(values, axis=1, out=total[:, 1:])
+                sums.append(total[:, span:] - total[:, :-span])
+            count, sum_y, sum_xy, sum_yy = sums
+
+            ends = days[span - 1 :]
+            sum_x = span * ends - span * (span - 1) / 2
+            sum_xx = np.cumsum(days**2)
+            sum_xx = sum_xx[span - 1 :] - np.concatenate([[0], sum_xx[:-span]])
+
+            slope = (span * sum_xy - sum_x * sum_y) / (
+                span * sum_xx - sum_x**2
+            )
+            intercept = (sum_y - slope * sum_x) / span
+            residual = sum_yy - intercept * sum_y - slope * sum_xy
+
+            fitted = count == span
+            trend = {
+                part: np.full(averages.shape, np.nan)
+                for part in ("level", "rate", "spread")
+            }
+            trend["level"][:, span - 1 :] = np.where(
+                fitted, intercept + slope * ends, np.nan
+            )
+            trend["rate"][:, span - 1 :] = np.where(fitted, slope, np.nan)
+            trend["spread"][:, span - 1 :] = np.where(
+                fitted, np.sqrt(np.maximum(residual, 0) / (span - 2)), np.nan
+            )
+
+            self.cache[key] = trend
+
+        return self.cache[key]
+
+    def projection(
+        self, name, window, col, horizons, rows=slice(None), span=GROWTH_DAYS
+    ):
+
+        horizons = np.asarray(horizons, dtype=float)
+
+        if col is None:
+            shape = np.shape(self.present[rows, 0]) + horizons.shape
+            missing = np.full(shape, np.nan)
+            return missing, missing, missing
+
+        trend = self.trend(name, window, span)
+        level = trend["level"][rows, col][..., None]
+        rate = trend["rate"][rows, col][..., None]
+        spread = trend["spread"][rows, col][..., None]
+
+        offset = horizons + (span - 1) / 2
+        error = spread * np.sqrt(
+            1 + 1 / span + offset**2 / (span * (span**2 - 1) / 12)
+        )
+        center = level + rate * horizons
+
+        return (
+            np.exp(center),
+            np.exp(center - PROJECTION_Z * error),
+            np.exp(center + PROJECTION_Z * error),
+        )
+
+    def growth(self, name, window, span=GROWTH_DAYS):
+
+        key = (name, "growth", window, span)
+
+        if key not in self.cache:
+            averages = self.window_average(name, window)
+            rate = self.trend(name, window, span)["rate"]
+
+            ratio = np.full(averages.shape, np.nan)
+            doubling = np.full(averages.shape, np.nan)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ratio[:, 7:] = averages[:, 7:] / averages[:, :-7]
+                np.divide(np.log(2), rate, out=doubling, where=rate != 0)
+
+            self.cache[key] = {
+                "rate": rate,
+                "doubling": doubling,
+                "ratio": ratio,
+            }
+
+        return self.cache[key]
+
+    def max_average(self, name, window, per_capita=False, kind=None):
+
+        key = (name, window, per_capita, kind)
+
+        if key not in self.cache:
+            if kind is None:
+                rows = slice(None)
+            else:
+                rows = self.kinds == kind
+            result = self.window_average(name, window, rows)
+            if per_capita:
+                result = result / self.populations[rows, None] * 100000
+            self.cache[key] = np.nanmax(result)
+
+        return self.cache[key]
+
+
+def build_case_store(states_data, counties_data, nnl_data):
+
+    states = states_data.loc[:, ("date", "state", "cases", "deaths")]
+    states = states.rename(columns={"state": "region"})
+    states["kind"] = "state"
+
+    counties = counties_data.loc[:, ("date", "cases", "deaths")]
+    counties["region"] = (
+        counties_data["state"] + ", " + counties_data["county"]
+    )
+    counties["kind"] = "county"
+
+    frames = [states, counties]
+
+    if nnl_data is not None:
+        sites = nnl_data.loc[:, ("date", "site", "cases")]
+        sites = sites.rename(columns={"site": "region"})
+        sites["kind"] = "site"
+        frames.append(sites)
+
+    frame = pd.concat(frames, ignore_index=True)
+
+    store = RegionStore.from_frame(
+        frame, "region", "date", ("cases", "deaths")
+    )
+    store.totals = {"cases", "deaths"}
+    for name in store.totals:
+        store.fill_gaps(name)
+
+    kinds = frame.drop_duplicates("region").set_index("region")["kind"]
+    store.kinds = kinds[store.regions].values
+
+    populations = np.full(len(store.regions), np.nan)
+    for i, region in enumerate(store.regions):
+        try:
+            populations[i] = population(region)
+        except Exception:
+            pass
+    store.populations = populations
+
+    return store
+
+
+def build_tracking_store(data):
+
+    store = RegionStore.from_frame(
+        data,
+        "state",
+        "datetime",
+        (
+            "positive",
+            "positiveIncrease",
+            "positivity",
+            "totalTestResults",
+            "totalTestResultsIncrease",
+        ),
+    )
+
+    store["totalTestResultsDiff"] = np.diff(
+        store["totalTestResults"], axis=1, prepend=np.nan
+    )
+
+    store.totals = {"positive", "totalTestResults"}
+    store.ratios = {"positivity": ("positive", "totalTestResults", 100)}
+
+    return store
+
+
+def constant_positivity_projection(store, constant_date, window=7):
+
+    col = store.position(constant_date)
+    if col is None:
+        positivity = np.full(len(store.regions), np.nan)
+    else:
+        positivity = store["positivity"][:, col]
+
+    return (
+        positivity[:, None]
+        / 100
+        * store.rolling("totalTestResultsDiff", window)
+    )
+
+
+def constant_testing_projection(store, constant_date, window=7):
+
+    col = store.position(constant_date)
+    if col is None:
+        total_tests = np.full(len(store.regions), np.nan)
+    else:
+        total_tests = store["totalTestResultsIncrease"][:, col]
+
+    return total_tests[:, None] / 100 * store.rolling("positivity", window)
+
+
+class RegionIndex:
+    def __init__(self, regions):
+
+        self.regions = list(regions)
+
+        suffixes = sorted(
+            (region.lower()[start:], start, i)
+            for i, region in enumerate(self.regions)
+            for start in range(len(region))
+        )
+
+        self.suffixes = [suffix for suffix, _, _ in suffixes]
+        self.positions = [(start, i) for _, start, i in suffixes]
+
+    def search(self, text, limit=SEARCH_LIMIT):
+
+        text = text.strip().lower()
+        if not text:
+            return self.regions[:limit]
+
+        lo = bisect_left(self.suffixes, text)
+        hi = bisect_left(self.suffixes, text[:-1] + chr(ord(text[-1]) + 1))
+
+        ranks = dict()
+        for start, i in self.positions[lo:hi]:
+            if start == 0:
+                rank = 0
+            elif self.regions[i][start - 1] in " ,-":
+                rank = 1
+            else:
+                rank = 2
+            ranks[i] = min(rank, ranks.get(i, rank))
+
+        matches = sorted(ranks, key=lambda i: (ranks[i], self.regions[i]))
+
+        return [self.regions[i] for i in matches[:limit]]
+
+
+def ranking_values(store, metric, window, rows):
+
+    if metric == "new cases":
+        return store.window_average("cases", window, rows)
+
+    if metric in ("cases per 100,000", "deaths per 100,000"):
+        values = store.window_average(metric.split()[0], window, rows)
+        return values / store.populations[rows, None] * 100000
+
+    averages = store.window_average("cases", window, rows)
+
+    result = np.full(averages.shape, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result[:, 7:] = averages[:, 7:] / averages[:, :-7] - 1
+
+    return result
+
+
+def lagged_correlation(first, second, lags):
+
+    first_valid = np.isfinite(first)
+    second_valid = np.isfinite(second)
+
+    first = np.where(first_valid, first, 0)
+    second = np.where(second_valid, second, 0)
+    first_valid = first_valid.astype(float)
+    second_valid = second_valid.astype(float)
+
+    second_terms = np.concatenate(
+        [second_valid, second, second * second], axis=0
+    ).T
+    regions = len(second)
+
+    days = first.shape[1]
+    result = np.full((len(first), regions, len(lags)), np.nan)
+
+    for i, lag in enumerate(lags):
+        early = slice(max(-lag, 0), days - max(lag, 0))
+        late = slice(max(lag, 0), days - max(-lag, 0))
+
+        x = first[:, early]
+        x_terms = np.concatenate([first_valid[:, early], x, x * x], axis=0)
+        sums = x_terms @ second_terms[late]
+
+        rows = len(first)
+        count = sums[:rows, :regions]
+        sum_x = sums[rows : 2 * rows, :regions]
+        sum_xx = sums[2 * rows :, :regions]
+        sum_y = sums[:rows, regions : 2 * regions]
+        sum_xy = sums[rows : 2 * rows, regions : 2 * regions]
+        sum_yy = sums[:rows, 2 * regions :]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            covariance = sum_xy - sum_x * sum_y / count
+            variance = (sum_xx - sum_x**2 / count) * (
+                sum_yy - sum_y**2 / count
+            )
+            result[:, :, i] = np.where(
+                (count >= CORRELATION_MIN_DAYS) & (variance > 0),
+                covariance / np.sqrt(variance),
+                np.nan,
+            )
+
+    return result
+
+
+class RankingIndex:
+    def __init__(self, regions, values):
+
+        self.regions = np.array(regions, dtype=object)
+        self.values = values
+
+        valid = np.isfinite(values)
+        keys = np.where(valid, -values, np.inf)
+
+        self.order = np.argsort(keys, axis=0, kind="stable").T.astype(np.int32)
+        self.valid = valid.sum(axis=0)
+
+    def top(self, col, count):
+
+        if col is None:
+            return [], np.array([])
+
+        rows = self.order[col, : min(count, self.valid[col])]
+
+        return self.regions[rows].tolist(), self.values[rows, col]
+
+
+class DataStore:
+    def __init__(self, generation, cases, tracking, groups=None):
+
+        self.generation = generation
+        self.cases = cases
+        self.tracking = tracking
+
+        self.groups = dict()
+
+        if groups:
+            self.groups = {
+                name: members
+                for name, members in groups.items()
+                if any(member in cases.index for member in members)
+            }
+            grouped = self.aggregate(self.groups)
+            self.cases = cases.extend(grouped.cases)
+            self.tracking = tracking.extend(grouped.tracking)
+
+        self.states = self.regions("state")
+        self.counties = self.regions("county")
+        self.sites = self.regions("site")
+
+        self.indexes = dict()
+        self.rankings = dict()
+        self.correlations = dict()
+        self.neighbours = None
+
+    def regions(self, kind):
+        return [
+            region
+            for region, region_kind in zip(
+                self.cases.regions, self.cases.kinds
+            )
+            if region_kind in (kind, f"{kind} group")
+        ]
+
+    def aggregate(self, groups):
+
+        groups = {
+            name: [
+                member
+                for region in regions
+                for member in self.groups.get(region, [region])
+            ]
+            for name, regions in groups.items()
+        }
+
+        return DataStore(
+            self.generation,
+            self.cases.aggregate(groups),
+            self.tracking.aggregate(groups, STATE_ABBRV),
+        )
+
+    def population(self, region):
+        return self.cases.populations[self.cases.row(region)]
+
+    def correlation(self, window, lags=CORRELATION_LAGS):
+
+        key = (window, lags)
+
+        if key not in self.correlations:
+            sites = [
+                site
+                for site, kind in zip(self.cases.regions, self.cases.kinds)
+                if kind == "site" and site in NNL_COUNTIES
+            ]
+            states = {NNL_COUNTIES[site].split(", ")[0] for site in sites}
+            counties = [
+                region
+                for region, kind in zip(self.cases.regions, self.cases.kinds)
+                if kind == "county" and region.split(", ")[0] in states
+            ]
+
+            averages = self.cases.window_average("cases", window)
+            self.correlations[key] = (
+                sites,
+                counties,
+                lagged_correlation(
+                    averages[[self.cases.row(site) for site in sites]],
+                    averages[[self.cases.row(county) for county in counties]],
+                    np.arange(-lags, lags + 1),
+                ),
+            )
+
+        return self.correlations[key]
+
+    def neighbourhood(self):
+
+        if self.neighbours is None:
+            adjacency = load_adjacency("counties", read_county_shapes)
+            names = [
+                ", ".join(parse_detailed_name(name))
+                for name in adjacency["names"]
+            ]
+
+            members = {
+                region: {region}
+                for region, kind in zip(self.cases.regions, self.cases.kinds)
+                if kind == "county"
+            }
+            for first, second in adjacency["edges"]:
+                first, second = names[first], names[second]
+                if first in members and second in members:
+                    members[first].add(second)
+                    members[second].add(first)
+
+            for name, regions in self.groups.items():
+                union = set().union(
+                    *(members.get(region, set()) for region in regions)
+                )
+                if union and name in self.cases.index:
+                    members[name] = union
+
+            self.neighbours = self.cases.aggregate(
+                {
+                    region: sorted(regions)
+                    for region, regions in members.items()
+                }
+            )
+
+        return self.neighbours
+
+    def date_range(self, kind):
+
+        present = self.cases.present[self.cases.kinds == kind]
+        cols = np.flatnonzero(present.any(axis=0))
+
+        return (
+            self.cases.dates[cols[0]].date(),
+            self.cases.dates[cols[-1]].date(),
+        )
+
+    def ranking(self, metric, window, kind="county"):
+
+        key = (metric, window, kind)
+
+        if key not in self.rankings:
+            rows = np.array(
+                [
+                    row
+                    for row in np.flatnonzero(self.cases.kinds == kind)
+                    if self.cases.regions[row].split(", ")[-1].lower()
+                    != "unknown"
+                ],
+                dtype=int,
+            )
+            self.rankings[key] = RankingIndex(
+                [self.cases.regions[row] for row in rows],
+                ranking_values(self.cases, metric, window, rows),
+            )
+
+        return self.rankings[key]
+
+    def search(self, kind, text, limit=SEARCH_LIMIT):
+
+        if kind not in self.indexes:
+            self.indexes[kind] = RegionIndex(self.regions(kind))
+
+        return self.indexes[kind].search(text, limit)
+
+
+STORE = None
+STORE_LOCK = threading.Lock()
+RELOADING = False
+SESSIONS = weakref.WeakKeyDictionary()
+API_CACHE = dict()
+
+
+def build_store(generation):
+
+    cases = build_case_store(
+        read_states_data(), read_counties_data(), read_nnl_data()
+    )
+    tracking = build_tracking_store(read_tracking_data())
+
+    store = DataStore(generation, cases, tracking, read_region_groups())
+    store.cases.trend("cases", ROLLING_DAYS)
+
+    return store
+
+
+def write_snapshot(store):
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+
+    directory = tempfile.mkdtemp(dir=SNAPSHOT_DIR)
+    store.cases.save(directory, "cases")
+    store.tracking.save(directory, "tracking")
+    with open(os.path.join(directory, "groups.pkl"), "wb") as fileobj:
+        pickle.dump(store.groups, fileobj)
+
+    try:
+        os.rename(directory, os.path.join(SNAPSHOT_DIR, store.generation))
+    except OSError:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def attach_snapshot(generation):
+
+    directory = os.path.join(SNAPSHOT_DIR, generation)
+
+    store = DataStore(
+        generation,
+        RegionStore.attach(directory, "cases"),
+        RegionStore.attach(directory, "tracking"),
+    )
+    with open(os.path.join(directory, "groups.pkl"), "rb") as fileobj:
+        store.groups = pickle.load(fileobj)
+
+    return store
+
+
+def load_store():
+
+    generation = read_generation()
+
+    if generation is None:
+        return build_store(generation)
+
+    if not os.path.exists(os.path.join(SNAPSHOT_DIR, generation)):
+        write_snapshot(build_store(generation))
+
+    return attach_snapshot(generation)
+
+
+def current_store():
+
+    global STORE
+
+    with STORE_LOCK:
+        if STORE is None:
+            STORE = load_store()
+
+    return STORE
+
+
+async def reload_store():
+
+    global STORE, RELOADING
+
+    if RELOADING or read_generation() == current_store().generation:
+        return
+
+    RELOADING = True
+    try:
+        store = await IOLoop.current().run_in_executor(None, load_store)
+    finally:
+        RELOADING = False
+
+    STORE = store
+    del store
+
+    API_CACHE.clear()
+
+    for doc, displays in list(SESSIONS.items()):
+        doc.add_next_tick_callback(partial(refresh_displays, displays))
+
+
+def refresh_displays(displays):
+
+    for display in displays:
+        display.refresh()
+
+
+def block_means(values, step):
+
+    blocks = -(-len(values) // step)
+
+    padded = np.full(blocks * step, np.nan)
+    padded[: len(values)] = values
+    padded = padded.reshape(blocks, step)
+
+    count = (~np.isnan(padded)).sum(axis=1)
+
+    return np.divide(
+        np.nansum(padded, axis=1),
+        count,
+        out=np.full(blocks, np.nan),
+        where=count > 0,
+    )
+
+
+def refine_displays(displays, event):
+
+    for display in displays:
+        if isinstance(display, StateDisplay):
+            display.refine()
+
+
+def same_column(old, new):
+
+    if len(old) != len(new):
+        return False
+
+    if len(new) and isinstance(new[0], np.ndarray):
+        return all(a is b or same_column(a, b) for a, b in zip(old, new))
+
+    old = np.asarray(old)
+    new = np.asarray(new)
+
+    if old.dtype.kind == "f" and new.dtype.kind == "f":
+        return np.array_equal(old, new, equal_nan=True)
+
+    return np.array_equal(old, new)
+
+
+def changed_runs(old, new):
+
+    old = np.asarray(old)
+    new = np.asarray(new)
+
+    differ = old != new
+    if old.dtype.kind == "f" and new.dtype.kind == "f":
+        differ &= ~(np.isnan(old) & np.isnan(new))
+
+    edges = np.flatnonzero(np.diff(differ, prepend=False, append=False))
+
+    return list(zip(edges[::2], edges[1::2]))
+
+
+def update_source(source, data):
+
+    replace = dict()
+    patches = dict()
+
+    for key, values in data.items():
+
+        old = source.data.get(key)
+
+        if old is not None and same_column(old, values):
+            continue
+
+        if (
+            old is None
+            or len(old) != len(values)
+            or not len(values)
+            or isinstance(values[0], np.ndarray)
+            or np.asarray(values).dtype.kind == "M"
+        ):
+            replace[key] = values
+            continue
+
+        runs = changed_runs(old, values)
+        if sum(stop - start for start, stop in runs) > PATCH_FRACTION * len(
+            values
+        ):
+            replace[key] = values
+        else:
+            patches[key] = [
+                (slice(start, stop), np.asarray(values)[start:stop])
+                for start, stop in runs
+            ]
+
+    if replace:
+        source.data.update(replace)
+    if patches:
+        source.patch(patches)
+
+
+def per_capita_label(label):
+
+    if label.startswith("Total New "):
+        return f"{label[len('Total '):]} per 100,000"
+
+    return label
+
+
+def range_timestamp(value):
+
+    if isinstance(value, (int, float)):
+        return pd.Timestamp(value, unit="ms")
+
+    return pd.Timestamp(value)
+
+
+def series_store(data_store, data_type):
+
+    if data_type == "neighbourhood cases":
+        return data_store.neighbourhood()
+
+    return data_store.cases
+
+
+def get_projection(region, data_type, window, data_store=None):
+
+    if data_store is None:
+        data_store = current_store()
+
+    if data_type not in ("cases", "deaths", "neighbourhood cases"):
+        return None
+
+    store = series_store(data_store, data_type)
+    row = store.row(region)
+    present = np.flatnonzero(store.present[row])
+    if not len(present):
+        return None
+
+    horizons = np.arange(1, PROJECTION_DAYS + 1)
+    mean, low, high = store.projection(
+        data_type.split()[-1], window, present[-1], horizons, rows=row
+    )
+    dates = store.dates[present[-1]] + pd.to_timedelta(horizons, unit="D")
+
+    return dates, mean, low, high
+
+
+def get_data(
+    region,
+    per_capita=False,
+    data_type="cases",
+    constant_date=None,
+    window=ROLLING_DAYS,
+    data_store=None,
+):
+
+    if data_store is None:
+        data_store = current_store()
+
+    data = dict()
+    test_data = None
+    tot_positive = None
+    tot_testing = None
+
+    if data_type == "weekly growth":
+
+        store = data_store.cases
+        row = store.row(region)
+        present = store.present[row]
+
+        dates = pd.Series(store.dates[present])
+        avg_dates = dates - timedelta(days=window) / 2
+
+        growth = store.growth("cases", window)
+        data = pd.Series((growth["ratio"][row][present] - 1) * 100)
+        avg_data = pd.Series(np.expm1(7 * growth["rate"][row][present]) * 100)
+        label = "Weekly Growth (%)"
+
+    elif data_type in ("cases", "deaths", "neighbourhood cases"):
+
+        store = series_store(data_store, data_type)
+        row = store.row(region)
+        present = store.present[row]
+
+        dates = pd.Series(store.dates[present])
+        avg_dates = dates - timedelta(days=window) / 2
+
+        name = data_type.split()[-1]
+        data = store.window_average(name, 1, row)[present]
+        avg_data = store.window_average(name, window, row)[present]
+
+        if not per_capita:
+            label = f"Total New {data_type.title()}"
+        else:
+            pop = store.populations[row]
+            data = data / pop * 100000
+            avg_data = avg_data / pop * 100000
+            label = f"New {data_type.title()} per 100,000"
+
+        data = pd.Series(data)
+        avg_data = pd.Series(avg_data)
+
+    elif data_type in (
+        "testing",
+        "positivity",
+        "constant positivity",
+        "constant testing",
+    ):
+
+        store = data_store.tracking
+        row = store.row(STATE_ABBRV.get(region, region))
+        present = store.present[row]
+
+        date_offset = timedelta(days=window) / 2
+
+        dates = pd.Series(store.dates[present])
+        avg_dates = dates - date_offset
+
+        if data_type == "positivity":
+            data = store["positivity"][row]
+            avg_data = store.rolling("positivity", window)[row]
+            tot_positive = pd.Series(store["positive"][row][present] * 100)
+            tot_testing = pd.Series(store["totalTestResults"][row][present])
+            label = "Positivity (%)"
+        elif data_type == "testing":
+            data = store["totalTestResultsIncrease"][row]
+            avg_data = store.rolling("totalTestResultsIncrease", window)[row]
+            label = "Total Tests"
+        else:
+            data = store["positiveIncrease"][row]
+            avg_data = store.rolling("positiveIncrease", window)[row]
+            if data_type == "constant positivity":
+                projection = constant_positivity_projection(
+                    store, constant_date, window
+                )
+            else:
+                projection = constant_testing_projection(
+                    store, constant_date, window
+                )
+            test_data = pd.Series(projection[row][present])
+            label = "Cases"
+
+        if data_type != "positivity" and per_capita:
+            pop = data_store.population(region)
+            data = data / pop * 100000
+            avg_data = avg_data / pop * 100000
+
+        data = pd.Series(data[present])
+        avg_data = pd.Series(avg_data[present])
+
+        if data_type not in ("positivity", "testing"):
+            if per_capita:
+                label = f"New {label.title()} per 100,000"
+            else:
+                label = f"Total New {label.title()}"
+
+    return (
+        dates,
+        avg_dates,
+        data,
+        avg_data,
+        test_data,
+        label,
+        tot_positive,
+        tot_testing,
+    )
+
+
+class StateDisplay:
+    def __init__(self, dataset=None):
+
+        if dataset is None:
+            dataset = current_store().states
+
+        self.dataset = dataset
+
+        self.state_selection = MultiSelect(
+            title="States:",
+            options=self.dataset,
+            value=["New York", "Texas"],
+            sizing_mode="stretch_both",
+        )
+        self.per_capita = RadioGroup(
+            labels=["Total", "Per Capita"],
+            active=0,
+            sizing_mode="stretch_width",
+        )
+        self.data_getter = RadioGroup(
+            labels=[
+                "Cases",
+                "Deaths",
+                "Positivity",
+                "Testing",
+                "Constant Positivity",
+                "Constant Testing",
+                "Weekly Growth",
+            ],
+            active=0,
+            sizing_mode="stretch_width",
+        )
+        self.plot_type = RadioGroup(
+            labels=["Linear", "Logarithmic"],
+            active=0,
+            sizing_mode="stretch_width",
+        )
+
+        self.window = RadioGroup(
+            labels=[f"{days}-day average" for days in ROLLING_WINDOWS],
+            active=ROLLING_WINDOWS.index(ROLLING_DAYS),
+            sizing_mode="stretch_width",
+        )
+
+        self.constant_date = DatePicker(
+            title="Constant Date",
+            value=(datetime.today() - timedelta(days=1)).date(),
+            sizing_mode="stretch_width",
+        )
+
+        self.show_total = CheckboxGroup(
+            labels=["Show total"], sizing_mode="stretch_width",
+        )
+
+        self.total_only = CheckboxGroup(
+            labels=["Total only"], sizing_mode="stretch_width",
+        )
+
+        self.src = None
+        self.p = None
+        self.logp = None
+
+        self.search = TextInput(
+            title="Search:",
+            placeholder="Type part of a name",
+            visible=False,
+            sizing_mode="stretch_width",
+        )
+        self.search_kind = "state"
+
+        self.date_column = "avg_date"
+        self.full_data = None
+        self.loaded_start = None
+        self.coarse = False
+
+        self.dependencies = [
+            ("state_selection", "value", "data"),
+            ("data_getter", "active", "data"),
+            ("window", "active", "data"),
+            ("constant_date", "value", "data"),
+            ("show_total", "active", "totals"),
+            ("total_only", "active", "layout"),
+        ]
+        self.stale = set(UPDATE_STAGES)
+
+        self.series = dict()
+        self.series_params = None
+        self.total = None
+        self.total_scale = None
+
+        self.scale = None
+        self.per_capita_callback = None
+
+        self.tooltips = [("State", "@state")]
+
+    def series_parameters(self):
+
+        return (
+            self.data_getter.labels[self.data_getter.active].lower(),
+            self.constant_date.value,
+            ROLLING_WINDOWS[self.window.active],
+        )
+
+    def series_scale(self, region, data_store=None):
+
+        if data_store is None:
+            data_store = current_store()
+
+        if self.series_params[0] in UNSCALED_TYPES:
+            return 1.0
+
+        if self.series_params[0] == "neighbourhood cases":
+            store = data_store.neighbourhood()
+            return store.populations[store.row(region)] / 100000
+
+        return data_store.population(region) / 100000
+
+    def update_series(self, state_list):
+
+        params = self.series_parameters()
+        if params != self.series_params:
+            self.series = dict()
+            self.series_params = params
+
+        for state_name in state_list:
+            if state_name not in self.series:
+                self.series[state_name] = get_data(state_name, False, *params)
+
+    def update_totals(self, state_list):
+
+        self.total = None
+
+        if self.show_total.active == [0] and state_list:
+            totals = current_store().aggregate({"Total": state_list})
+            self.total = get_data(
+                "Total", False, *self.series_params, data_store=totals
+            )
+            self.total_scale = self.series_scale("Total", totals)
+
+    def make_dataset(self, state_list):
+
+        by_state = {
+            "avg_date": [],
+            "avg_data": [],
+            "scale": [],
+            "state": [],
+            "color": [],
+            "line-width": [],
+        }
+
+        color_cycle = cycle(Category20_20)
+        palette = [next(color_cycle) for _ in self.dataset]
+
+        show_total = self.show_total.active == [0]
+        total_only = self.total_only.active == [0]
+
+        for state_name in state_list:
+
+            (
+                dates,
+                avg_dates,
+                data,
+                avg_data,
+                test_data,
+                label,
+                tot_positive,
+                tot_testing,
+            ) = self.series[state_name]
+
+            if len(state_list) == 1 or not show_total or not total_only:
+                by_state["avg_date"].append(avg_dates.values)
+                by_state["avg_data"].append(avg_data.values)
+                by_state["scale"].append(self.series_scale(state_name))
+
+                by_state["state"].append(state_name)
+                by_state["color"].append(
+                    palette[self.dataset.index(state_name)]
+                )
+                by_state["line-width"].append(1)
+
+        if self.total is not None:
+            (
+                dates,
+                avg_dates,
+                data,
+                avg_data,
+                test_data,
+                label,
+                tot_positive,
+                tot_testing,
+            ) = self.total
+
+            by_state["avg_date"].append(avg_dates.values)
+            by_state["avg_data"].append(avg_data.values)
+            by_state["scale"].append(self.total_scale)
+            by_state["state"].append("Total")
+            by_state["color"].append("black")
+            by_state["line-width"].append(2)
+
+        return label, by_state
+
+    def make_plot(self):
+
+        self.scale = CustomJSTransform(
+            args=dict(toggle=self.per_capita, source=self.src),
+            v_func=SCALE_LINES_JS,
+        )
+
+        self.p = figure(
+            x_axis_label="Date",
+            x_axis_type="datetime",
+            y_axis_label="Total Cases",
+            width=900,
+        )
+
+        self.p.multi_line(
+            source=self.src,
+            xs="avg_date",
+            ys=transform("avg_data", self.scale),
+            legend_field="state",
+            color="color",
+            line_width="line-width",
+        )
+
+        self.p.add_tools(HoverTool(tooltips=self.tooltips))
+
+        self.p.legend.location = "top_left"
+
+        self.logp = figure(
+            x_axis_label="Date",
+            x_axis_type="datetime",
+            y_axis_label="Total Cases",
+            y_axis_type="log",
+            width=900,
+        )
+
+        self.logp.multi_line(
+            source=self.src,
+            xs="avg_date",
+            ys=transform("avg_data", self.scale),
+            legend_field="state",
+            color="color",
+            line_width="line-width",
+        )
+
+        self.logp.add_tools(HoverTool(tooltips=self.tooltips))
+
+        self.logp.legend.location = "top_left"
+
+    def latest_date(self):
+
+        return max(
+            (
+                pd.Timestamp(np.max(dates))
+                for dates in self.full_data[self.date_column]
+                if len(dates)
+            ),
+            default=pd.Timestamp.today(),
+        )
+
+    def window_data(self, start, end=None):
+
+        data = dict(self.full_data)
+        for key in (self.date_column, "avg_data"):
+            data[key] = []
+
+        for dates, values in zip(
+            self.full_data[self.date_column], self.full_data["avg_data"]
+        ):
+            mask = dates >= np.datetime64(start)
+            if end is not None:
+                mask &= dates < np.datetime64(end)
+            data[self.date_column].append(dates[mask])
+            data["avg_data"].append(values[mask])
+
+        return data
+
+    def coarsen(self, data):
+
+        data = dict(data)
+        for key in (self.date_column, "avg_data"):
+            data[key] = [
+                values[(len(values) - 1) % COARSE_STEP :: COARSE_STEP]
+                for values in data[key]
+            ]
+
+        return data
+
+    def refine(self):
+
+        if self.coarse:
+            self.coarse = False
+            update_source(self.src, self.window_data(self.loaded_start))
+
+    def extend_data(self, old_start):
+
+        if self.coarse:
+            self.refine()
+            return
+
+        data = self.window_data(self.loaded_start)
+
+        rows = []
+        ends = []
+        for i, dates in enumerate(data[self.date_column]):
+            end = np.searchsorted(dates, np.datetime64(old_start)) + 1
+            if end > 1:
+                rows.append(i)
+                ends.append(end)
+
+        if not rows:
+            return
+
+        segments = {
+            key: [data[key][i] for i in rows]
+            for key in data
+            if key not in (self.date_column, "avg_data")
+        }
+        for key in (self.date_column, "avg_data"):
+            segments[key] = [data[key][i][:end] for i, end in zip(rows, ends)]
+
+        self.src.stream(segments)
+
+    def load_history(self, attr, old, new):
+
+        if new is None or self.full_data is None:
+            return
+
+        start = range_timestamp(new)
+        if start >= self.loaded_start:
+            return
+
+        old_start = self.loaded_start
+        self.loaded_start = start - HISTORY_WINDOW
+
+        self.extend_data(old_start)
+
+    def update_data(self, label, full_data):
+
+        self.full_data = full_data
+
+        if self.loaded_start is None:
+            self.loaded_start = self.latest_date() - HISTORY_WINDOW
+
+        data = self.window_data(self.loaded_start)
+
+        if self.src is None:
+            self.src = ColumnDataSource(self.coarsen(data))
+            self.coarse = True
+            self.make_plot()
+            self.link_toggles()
+            for plot in (self.p, self.logp):
+                plot.x_range.range_padding = 0
+                plot.x_range.on_change("start", self.load_history)
+        else:
+            self.coarse = False
+            update_source(self.src, data)
+
+        if self.per_capita_callback is not None:
+            labels = [label, per_capita_label(label)]
+            self.per_capita_callback.args["labels"] = labels
+            label = labels[self.per_capita.active]
+
+        self.p.yaxis.axis_label = label
+        self.logp.yaxis.axis_label = label
+
+    def scaled_sources(self):
+        return [self.src]
+
+    def link_toggles(self):
+
+        self.plot_type.js_on_change(
+            "active",
+            CustomJS(args=dict(p=self.p, logp=self.logp), code=PLOT_TYPE_JS),
+        )
+
+        if self.scale is None:
+            return
+
+        self.per_capita_callback = CustomJS(
+            args=dict(
+                sources=self.scaled_sources(),
+                axes=[self.p.yaxis[0], self.logp.yaxis[0]],
+                labels=["", ""],
+            ),
+            code=PER_CAPITA_JS,
+        )
+        self.per_capita.js_on_change("active", self.per_capita_callback)
+
+    def update_view(self):
+
+        if self.plot_type.active == 0:
+            self.p.visible = True
+            self.logp.visible = False
+        else:
+            self.p.visible = False
+            self.logp.visible = True
+
+        if len(self.data_getter.labels) == 1:
+            self.data_getter.visible = False
+
+        data_getter = self.data_getter.labels[self.data_getter.active].lower()
+        self.constant_date.visible = data_getter in (
+            "constant positivity",
+            "constant testing",
+        )
+
+    def search_options(self, text):
+
+        selected = list(self.state_selection.value)
+        matches = current_store().search(self.search_kind, text)
+
+        return selected + [match for match in matches if match not in selected]
+
+    def update_search(self, attr, old, new):
+        self.state_selection.options = self.search_options(new)
+
+    def invalidate(self, stage, attr, old, new):
+
+        self.stale.update(UPDATE_STAGES[UPDATE_STAGES.index(stage) :])
+
+        self.update(attr, old, new)
+
+    def update(self, attr, old, new):
+
+        stale = self.stale
+        self.stale = set()
+
+        states_to_plot = sorted(self.state_selection.value)
+
+        if "data" in stale:
+            self.update_series(states_to_plot)
+
+        if "totals" in stale:
+            self.update_totals(states_to_plot)
+
+        if "layout" in stale:
+            label, data = self.make_dataset(states_to_plot)
+            self.update_data(label, data)
+
+        self.update_view()
+
+        self.show_total.visible = len(states_to_plot) != 1
+        self.total_only.visible = self.show_total.active == [0]
+
+    def connect(self):
+
+        for name, attr, stage in self.dependencies:
+            getattr(self, name).on_change(
+                attr, partial(self.invalidate, stage)
+            )
+
+    def run(self):
+
+        self.search.on_change("value_input", self.update_search)
+        self.connect()
+
+        controls = column(
+            [
+                self.search,
+                self.state_selection,
+                self.per_capita,
+                self.data_getter,
+                self.plot_type,
+                self.window,
+                self.constant_date,
+                self.show_total,
+                self.total_only,
+            ],
+            sizing_mode="fixed",
+            width=300,
+            height=600,
+        )
+
+        self.update(None, None, None)
+
+        plots = column(self.p, self.logp)
+
+        return row(controls, plots, sizing_mode="stretch_both")
+
+    def refresh(self):
+
+        self.series_params = None
+        self.invalidate("data", None, None, None)
+
+
+class SingleStateDisplay(StateDisplay):
+    def __init__(self):
+
+        super().__init__()
+
+        self.state = "New York"
+        self.menu = current_store().states
+
+        self.date_column = "date"
+
+        self.state_selection = Dropdown(
+            menu=self.menu, label=self.state, sizing_mode="stretch_width"
+        )
+
+        self.projection_src = ColumnDataSource(
+            {
+                key: []
+                for key in ("avg_date", "projection", "low", "high", "scale")
+            }
+        )
+        self.projection = None
+
+        self.dependencies = [
+            ("data_getter", "active", "data"),
+            ("window", "active", "data"),
+            ("constant_date", "value", "data"),
+        ]
+
+    def make_dataset(self, state_name=""):
+
+        self.series_params = self.series_parameters()
+
+        (
+            dates,
+            avg_dates,
+            data,
+            avg_data,
+            test_data,
+            label,
+            tot_positive,
+            tot_testing,
+        ) = get_data(state_name, False, *self.series_params)
+
+        data_dict = {
+            "date": dates.values,
+            "avg_date": avg_dates.values,
+            "data": data.values,
+            "avg_data": avg_data.values,
+            "scale": np.full(len(dates), self.series_scale(state_name)),
+        }
+
+        if test_data is None:
+            data_dict["test_data"] = np.empty_like(data.values, dtype=float)
+            data_dict["test_data"][:] = np.NaN
+        else:
+            data_dict["test_data"] = test_data.values
+
+        self.projection = {key: [] for key in self.projection_src.data}
+
+        projection = get_projection(
+            state_name, self.series_params[0], self.series_params[2]
+        )
+        if projection is not None and len(dates):
+            future, mean, low, high = projection
+            offset = timedelta(days=self.series_params[2]) / 2
+            last = avg_data.values[-1:]
+            self.projection = {
+                "avg_date": np.concatenate(
+                    [avg_dates.values[-1:], (future - offset).values]
+                ),
+                "projection": np.concatenate([last, mean]),
+                "low": np.concatenate([last, low]),
+                "high": np.concatenate([last, high]),
+                "scale": np.full(len(future) + 1, data_dict["scale"][-1]),
+            }
+
+        return label, data_dict
+
+    def latest_date(self):
+
+        dates = self.full_data[self.date_column]
+        if not len(dates):
+            return pd.Timestamp.today()
+
+        return pd.Timestamp(np.max(dates))
+
+    def window_data(self, start, end=None):
+
+        dates = np.asarray(self.full_data[self.date_column])
+        mask = dates >= np.datetime64(start)
+        if end is not None:
+            mask &= dates < np.datetime64(end)
+
+        rows = np.flatnonzero(mask)[::-1]
+
+        return {
+            key: np.asarray(values)[rows]
+            for key, values in self.full_data.items()
+        }
+
+    def coarsen(self, data):
+
+        coarse = {
+            key: values[::COARSE_STEP]
+            for key, values in data.items()
+            if key in ("avg_date", "avg_data", "scale")
+        }
+
+        length = len(data["date"])
+        middles = np.arange(0, length, COARSE_STEP) + COARSE_STEP // 2
+        coarse["date"] = data["date"][np.minimum(middles, length - 1)]
+        coarse["data"] = block_means(data["data"], COARSE_STEP)
+        coarse["test_data"] = block_means(data["test_data"], COARSE_STEP)
+
+        return {key: coarse[key] for key in data}
+
+    def scaled_sources(self):
+        return [self.src, self.projection_src]
+
+    def extend_data(self, old_start):
+
+        if self.coarse:
+            self.refine()
+        else:
+            self.src.stream(self.window_data(self.loaded_start, old_start))
+
+    def make_plot(self):
+
+        self.scale = CustomJSTransform(
+            args=dict(toggle=self.per_capita, source=self.src),
+            v_func=SCALE_VALUES_JS,
+        )
+        projection_scale = CustomJSTransform(
+            args=dict(toggle=self.per_capita, source=self.projection_src),
+            v_func=SCALE_VALUES_JS,
+        )
+
+        self.p = figure(
+            x_axis_label="Date",
+            x_axis_type="datetime",
+            y_axis_label="Total Cases",
+            width=900,
+        )
+
+        self.p.vbar(
+            source=self.src,
+            x="date",
+            top=transform("data", self.scale),
+            color="orange",
+        )
+        self.p.line(
+            source=self.src,
+            x="avg_date",
+            y=transform("avg_data", self.scale),
+            line_width=2,
+        )
+        self.p.line(
+            source=self.src,
+            x="date",
+            y=transform("test_data", self.scale),
+            line_width=2,
+            line_dash="dashed",
+        )
+        self.p.varea(
+            source=self.projection_src,
+            x="avg_date",
+            y1=transform("low", projection_scale),
+            y2=transform("high", projection_scale),
+            color="gray",
+            fill_alpha=0.2,
+        )
+        self.p.line(
+            source=self.projection_src,
+            x="avg_date",
+            y=transform("projection", projection_scale),
+            line_width=2,
+            line_dash="dotted",
+        )
+
+        self.p.legend.visible = False
+
+        self.logp = figure(
+            x_axis_label="Date",
+            x_axis_type="datetime",
+            y_axis_label="Total Cases",
+            y_axis_type="log",
+            width=900,
+        )
+
+        self.logp.vbar(
+            source=self.src,
+            x="date",
+            bottom=1e-10,
+            top=transform("data", self.scale),
+            color="orange",
+        )
+        self.logp.line(
+            source=self.src,
+            x="avg_date",
+            y=transform("avg_data", self.scale),
+            line_width=2,
+        )
+        self.logp.line(
+            source=self.src,
+            x="date",
+            y=transform("test_data", self.scale),
+            line_width=2,
+            line_dash="dashed",
+        )
+        self.logp.varea(
+            source=self.projection_src,
+            x="avg_date",
+            y1=transform("low", projection_scale),
+            y2=transform("high", projection_scale),
+            color="gray",
+            fill_alpha=0.2,
+        )
+        self.logp.line(
+            source=self.projection_src,
+            x="avg_date",
+            y=transform("projection", projection_scale),
+            line_width=2,
+            line_dash="dotted",
+        )
+
+        self.logp.legend.visible = False
+
+    def update(self, attr, old, new):
+
+        stale = self.stale
+        self.stale = set()
+
+        if "data" in stale:
+            label, data = self.make_dataset(self.state)
+            self.update_data(label, data)
+            update_source(self.projection_src, self.projection)
+            self.p.title.text = self.state
+
+        self.update_view()
+
+    def update_search(self, attr, old, new):
+        self.state_selection.menu = current_store().search(
+            self.search_kind, new
+        )
+
+    def update_selection(self, event):
+        self.state = event.item
+        self.state_selection.label = self.state
+        self.invalidate("data", None, None, None)
+
+    def run(self):
+
+        self.search.on_change("value_input", self.update_search)
+        self.state_selection.on_click(self.update_selection)
+        self.connect()
+
+        controls = column(
+            [
+                self.search,
+                self.state_selection,
+                self.per_capita,
+                self.data_getter,
+                self.plot_type,
+                self.window,
+                self.constant_date,
+            ],
+            sizing_mode="fixed",
+            width=300,
+            height=600,
+        )
+
+        self.update_selection(MenuItemClick(None, self.state))
+
+        plots = column(self.p, self.logp)
+
+        return row(controls, plots, sizing_mode="stretch_both")
+
+
+class SingleCountyDisplay(SingleStateDisplay):
+    def __init__(self):
+
+        super().__init__()
+
+        self.state = "New York, Washington"
+        self.search.visible = True
+        self.search_kind = "county"
+        self.menu = current_store().search(self.search_kind, "")
+
+        self.state_selection = Dropdown(
+            menu=self.menu, label=self.state, sizing_mode="stretch_width"
+        )
+
+        self.data_getter = RadioGroup(
+            labels=[
+                "Cases",
+                "Deaths",
+                "Weekly Growth",
+                "Neighbourhood Cases",
+            ],
+            active=0,
+            sizing_mode="stretch_width",
+        )
+
+
+class RatioDisplay(SingleStateDisplay):
+    def __init__(self):
+
+        super().__init__()
+
+        self.dependencies = [("window", "active", "data")]
+
+    def make_dataset(self, state_name=""):
+
+        window = ROLLING_WINDOWS[self.window.active]
+
+        store = current_store().cases
+        row = store.row(state_name)
+        present = store.present[row]
+
+        cases = store.window_average("cases", window, row)[present]
+        deaths = store.window_average("deaths", window, row)[present]
+
+        data_dict = {
+            "date": (store.dates[present] - timedelta(days=window) / 2).values,
+            "cases": cases,
+            "deaths": deaths,
+            "ratio": deaths / cases,
+        }
+
+        return "Total Cases and Deaths", data_dict
+
+    def coarsen(self, data):
+        return {key: values[::COARSE_STEP] for key, values in data.items()}
+
+    def make_plot(self):
+
+        self.p = figure(
+            x_axis_label="Date",
+            x_axis_type="datetime",
+            y_axis_label="Total Cases and Deaths",
+            width=900,
+        )
+
+        self.p.extra_y_ranges = {"ratio_axis": Range1d()}
+
+        axis = LinearAxis(y_range_name="ratio_axis")
+        axis.formatter = NumeralTickFormatter(format="0 %")
+        self.p.add_layout(axis, "right")
+
+        colors = Category20_3
+
+        self.p.line(
+            source=self.src,
+            x="date",
+            y="cases",
+            line_width=2,
+            color=colors[0],
+            legend_label="Cases",
+        )
+        self.p.line(
+            source=self.src,
+            x="date",
+            y="deaths",
+            line_width=2,
+            color=colors[1],
+            legend_label="Deaths",
+        )
+        self.p.line(
+            source=self.src,
+            x="date",
+            y="ratio",
+            line_width=2,
+            y_range_name="ratio_axis",
+            color=colors[2],
+            legend_label="Deaths/Cases",
+        )
+
+        self.p.legend.location = "top_left"
+
+        self.logp = figure(
+            x_axis_label="Date",
+            x_axis_type="datetime",
+            y_axis_label="Total Cases and Deaths",
+            y_axis_type="log",
+            width=900,
+        )
+
+        self.logp.extra_y_ranges = {"ratio_axis": Range1d()}
+
+        logaxis = LogAxis(y_range_name="ratio_axis")
+        logaxis.formatter = NumeralTickFormatter(format="0 %")
+        self.logp.add_layout(logaxis, "right")
+
+        self.logp.line(
+            source=self.src,
+            x="date",
+            y="cases",
+            line_width=2,
+            color=colors[0],
+            legend_label="Cases",
+        )
+        self.logp.line(
+            source=self.src,
+            x="date",
+            y="deaths",
+            line_width=2,
+            color=colors[1],
+            legend_label="Deaths",
+        )
+        self.logp.line(
+            source=self.src,
+            x="date",
+            y="ratio",
+            line_width=2,
+            y_range_name="ratio_axis",
+            color=colors[2],
+            legend_label="Deaths/Cases",
+        )
+
+        self.p.legend.location = "top_left"
+
+    def update(self, attr, old, new):
+
+        stale = self.stale
+        self.stale = set()
+
+        if "data" in stale:
+            label, data = self.make_dataset(self.state)
+            self.update_data(label, data)
+
+        self.update_view()
+
+        self.p.extra_y_ranges["ratio_axis"].start = 0.0
+        self.p.extra_y_ranges["ratio_axis"].end = 0.4
+
+        self.logp.extra_y_ranges["ratio_axis"].start = 0.001
+        self.logp.extra_y_ranges["ratio_axis"].end = 1.0
+
+        self.p.right[0].axis_label = "Deaths/Cases Ratio"
+        self.logp.right[0].axis_label = "Deaths/Cases Ratio"
+
+    def run(self):
+
+        self.state_selection.on_click(self.update_selection)
+        self.connect()
+
+        controls = column(
+            [self.state_selection, self.plot_type, self.window],
+            sizing_mode="fixed",
+            width=300,
+            height=600,
+        )
+
+        self.update_selection(MenuItemClick(None, self.state))
+
+        plots = column(self.p, self.logp)
+
+        return row(controls, plots, sizing_mode="stretch_both")
+
+
+class CountyDisplay(StateDisplay):
+    def __init__(self):
+
+        super().__init__(current_store().counties)
+
+        self.state_selection.title = "Counties:"
+        self.state_selection.value = ["New York, Washington", "Texas, Harris"]
+
+        self.search.visible = True
+        self.search_kind = "county"
+        self.state_selection.options = self.search_options("")
+
+        self.data_getter.labels = ["Cases", "Deaths", "Weekly Growth"]
+
+        self.tooltips = [("County", "@state")]
+
+
+class NNLDisplay(StateDisplay):
+    def __init__(self):
+
+        sites = list(current_store().sites)
+        sites += [
+            "New York, Schenectady",
+            "Pennsylvania, Allegheny",
+            "New York, Saratoga",
+            "Idaho, Bonneville",
+            "South Carolina, Berkeley",
+        ]
+
+        super().__init__(sorted(sites))
+
+        self.state_selection.title = "Locations:"
+        self.state_selection.value = [
+            "NNL Knolls",
+            "NNL Bettis",
+            "New York, Schenectady",
+            "Pennsylvania, Allegheny",
+        ]
+
+        self.data_getter.labels = ["Cases", "Weekly Growth"]
+
+        self.tooltips = [("Location", "@state")]
+
+
+class TopCountiesDisplay:
+    def __init__(self, target=None):
+
+        self.metric = RadioGroup(
+            labels=list(RANKING_METRICS), active=0, sizing_mode="stretch_width"
+        )
+        self.date = DatePicker(title="Date", sizing_mode="stretch_width")
+        self.window = RadioGroup(
+            labels=[f"{days}-day average" for days in ROLLING_WINDOWS],
+            active=ROLLING_WINDOWS.index(ROLLING_DAYS),
+            sizing_mode="stretch_width",
+        )
+        self.count = RadioGroup(
+            labels=[f"Top {count}" for count in TOP_COUNTS],
+            active=TOP_COUNTS.index(20),
+            sizing_mode="stretch_width",
+        )
+        self.button = Button(
+            label="Compare in County Comparisons",
+            visible=target is not None,
+            sizing_mode="stretch_width",
+        )
+
+        self.target = target
+
+        self.src = None
+        self.p = None
+
+        self.store = None
+
+        self.tooltips = [("County", "@name"), ("Value", "@value")]
+
+        self.bind(current_store())
+
+    def bind(self, store):
+
+        self.store = store
+
+        first, last = store.date_range("county")
+
+        if not self.date.enabled_dates or (
+            pd.Timestamp(self.date.value).date()
+            >= self.date.enabled_dates[0][1]
+        ):
+            self.date.value = last
+        self.date.enabled_dates = [(first, last)]
+
+    def make_dataset(self):
+
+        label = self.metric.labels[self.metric.active]
+        window = ROLLING_WINDOWS[self.window.active]
+        count = TOP_COUNTS[self.count.active]
+        col = self.store.cases.position(self.date.value)
+
+        names, values = self.store.ranking(label.lower(), window).top(
+            col, count
+        )
+
+        return label, {"name": names[::-1], "value": values[::-1]}
+
+    def make_plot(self):
+
+        self.p = figure(
+            y_range=FactorRange(factors=list(self.src.data["name"])),
+            x_axis_label="Value",
+            tooltips=self.tooltips,
+            width=900,
+            height=600,
+        )
+
+        self.p.hbar(
+            source=self.src,
+            y="name",
+            right="value",
+            height=0.8,
+            color=Category20_3[0],
+        )
+
+    def update(self, attr, old, new):
+
+        label, data = self.make_dataset()
+
+        if self.src is None:
+            self.src = ColumnDataSource(data)
+            self.make_plot()
+        else:
+            update_source(self.src, data)
+
+        self.p.y_range.factors = list(data["name"])
+
+        strdate = date.fromisoformat(str(self.date.value)).strftime(
+            "%B %d, %Y"
+        )
+        self.p.title.text = f"{label} on {strdate}"
+        self.p.xaxis.axis_label = label
+
+    def select(self):
+
+        names = list(self.src.data["name"])[::-1]
+        if not names:
+            return
+
+        selection = self.target.state_selection
+        selection.options = names + [
+            name for name in selection.options if name not in names
+        ]
+        selection.value = names
+
+    def run(self):
+
+        self.metric.on_change("active", self.update)
+        self.date.on_change("value", self.update)
+        self.window.on_change("active", self.update)
+        self.count.on_change("active", self.update)
+        self.button.on_click(self.select)
+
+        self.update(None, None, None)
+
+        controls = column(
+            [self.metric, self.date, self.window, self.count, self.button],
+            sizing_mode="fixed",
+            width=300,
+            height=600,
+        )
+
+        return row(controls, self.p)
+
+    def refresh(self):
+
+        self.bind(current_store())
+        self.update(None, None, None)
+
+
+class LagDisplay:
+    def __init__(self):
+
+        self.site = RadioGroup(
+            labels=[], active=0, sizing_mode="stretch_width"
+        )
+        self.window = RadioGroup(
+            labels=[f"{days}-day average" for days in ROLLING_WINDOWS],
+            active=ROLLING_WINDOWS.index(ROLLING_DAYS),
+            sizing_mode="stretch_width",
+        )
+
+        self.src = None
+        self.p = None
+
+        self.store = None
+
+        self.tooltips = [
+            ("County", "@county"),
+            ("Lag (days)", "@lag"),
+            ("Correlation", "@correlation{0.00}"),
+        ]
+
+        self.bind(current_store())
+
+    def bind(self, store):
+
+        self.store = store
+
+        selected = None
+        if self.site.labels:
+            selected = self.site.labels[self.site.active]
+
+        labels = [site for site in store.sites if site in NNL_COUNTIES]
+        self.site.labels = labels
+        self.site.active = labels.index(selected) if selected in labels else 0
+
+    def make_dataset(self):
+
+        site = self.site.labels[self.site.active]
+        window = ROLLING_WINDOWS[self.window.active]
+
+        sites, counties, values = self.store.correlation(window)
+
+        state = NNL_COUNTIES[site].split(", ")[0]
+        rows = [
+            i
+            for i, county in enumerate(counties)
+            if county.split(", ")[0] == state
+        ]
+        correlation = values[sites.index(site)][rows]
+
+        best = np.where(np.isnan(correlation), -np.inf, correlation)
+        best = best.max(axis=1)
+        order = np.argsort(-best, kind="stable")
+        names = [counties[rows[i]] for i in order]
+
+        lags = np.arange(-CORRELATION_LAGS, CORRELATION_LAGS + 1)
+
+        data = {
+            "county": np.repeat(np.array(names, dtype=object), len(lags)),
+            "lag": np.tile(lags, len(names)),
+            "correlation": correlation[order].ravel(),
+        }
+
+        return f"{site} and counties in {state}", names, data
+
+    def make_plot(self):
+
+        color_mapper = LinearColorMapper(
+            palette=RdBu11, low=-1, high=1, nan_color="lightgray"
+        )
+
+        self.p = figure(
+            x_range=(-CORRELATION_LAGS - 0.5, CORRELATION_LAGS + 0.5),
+            y_range=FactorRange(factors=[]),
+            x_axis_label=(
+                "Lag (days), positive when the county follows the site"
+            ),
+            tooltips=self.tooltips,
+            width=900,
+            height=900,
+        )
+
+        self.p.rect(
+            source=self.src,
+            x="lag",
+            y="county",
+            width=1,
+            height=1,
+            fill_color=transform("correlation", color_mapper),
+            line_color=None,
+        )
+
+        color_bar = ColorBar(
+            color_mapper=color_mapper,
+            ticker=BasicTicker(desired_num_ticks=5),
+            label_standoff=12,
+            border_line_color=None,
+            location=(0, 0),
+        )
+        self.p.add_layout(color_bar, "right")
+
+    def update(self, attr, old, new):
+
+        title, names, data = self.make_dataset()
+
+        if self.src is None:
+            self.src = ColumnDataSource(data)
+            self.make_plot()
+        else:
+            update_source(self.src, data)
+
+        self.p.y_range.factors = names[::-1]
+        self.p.title.text = f"Correlation of new cases, {title}"
+
+    def run(self):
+
+        self.site.on_change("active", self.update)
+        self.window.on_change("active", self.update)
+
+        self.update(None, None, None)
+
+        controls = column(
+            [self.site, self.window],
+            sizing_mode="fixed",
+            width=300,
+            height=600,
+        )
+
+        return row(controls, self.p)
+
+    def refresh(self):
+
+        self.bind(current_store())
+        self.update(None, None, None)
+
+
+class MapBase:
+    def __init__(self):
+
+        self.per_capita = RadioGroup(
+            labels=["Total", "Per Capita", "Logarithmic"],
+            active=0,
+            sizing_mode="stretch_width",
+        )
+        self.data_getter = RadioGroup(
+            labels=["Cases", "Deaths", "Positivity"],
+            active=0,
+            sizing_mode="stretch_width",
+        )
+        self.date = DatePicker(
+            title="Date",
+            name=f"{self.__class__.__name__}.date",
+            sizing_mode="stretch_width",
+        )
+        self.window = RadioGroup(
+            labels=[f"{days}-day average" for days in ROLLING_WINDOWS],
+            active=ROLLING_WINDOWS.index(ROLLING_DAYS),
+            sizing_mode="stretch_width",
+        )
+        self.constant_date = DatePicker(
+            title="Constant Date",
+            value=(datetime.today() - timedelta(days=1)).date(),
+            sizing_mode="stretch_width",
+        )
+        self.save_files = CheckboxGroup(
+            labels=["Save files"], sizing_mode="stretch_width"
+        )
+        self.button = Toggle(
+            label="► Play",
+            name=f"{self.__class__.__name__}.button",
+            sizing_mode="stretch_width",
+        )
+
+        self.tooltips = [("Name", "@name"), ("Value", "@value")]
+
+        self.src = None
+        self.p = None
+
+        self.store = None
+
+        self.geometry = None
+        self.level = len(GEOMETRY_TOLERANCES) - 1
+
+        self.callback = None
+        self.counter = None
+
+        self.tempdir = None
+        self.filenames = None
+
+    def bind(self, store):
+
+        self.store = store
+
+        first = store.cases.dates[0].date()
+        last = store.cases.dates[-1].date()
+
+        if not self.date.enabled_dates or (
+            pd.Timestamp(self.date.value).date()
+            >= self.date.enabled_dates[0][1]
+        ):
+            self.date.value = last
+        self.date.enabled_dates = [(first, last)]
+
+        first = store.tracking.dates[0].date()
+        last = store.tracking.dates[-1].date()
+
+        if not first <= pd.Timestamp(self.constant_date.value).date() <= last:
+            self.constant_date.value = last
+        self.constant_date.enabled_dates = [(first, last)]
+
+    def refresh(self):
+
+        self.bind(current_store())
+        self.update(None, None, None)
+
+    def make_dataset(self):
+        raise NotImplementedError
+
+    def growth_at(self, rows, window, date):
+
+        store = self.store.cases
+        col = store.position(date)
+
+        if col is None:
+            missing = np.full(len(rows), np.nan)
+            return missing, missing
+
+        growth = store.growth("cases", window)
+        found = rows >= 0
+
+        weekly = np.where(
+            found, np.expm1(7 * growth["rate"][rows, col]) * 100, np.nan
+        )
+        doubling = np.where(found, growth["doubling"][rows, col], np.nan)
+
+        return weekly, doubling
+
+    def projection_at(self, rows, window, date, per_capita=False):
+
+        store = self.store.cases
+        found = rows >= 0
+
+        mean, low, high = store.projection(
+            "cases",
+            window,
+            store.position(date),
+            [PROJECTION_DAYS],
+            rows=np.where(found, rows, 0),
+        )
+        values = np.where(found, mean[:, 0], np.nan)
+
+        if not per_capita:
+            return f"Projected New Cases in {PROJECTION_DAYS} Days", values
+
+        return (
+            f"Projected New Cases per 100,000 in {PROJECTION_DAYS} Days",
+            values / np.where(found, store.populations[rows], np.nan) * 100000,
+        )
+
+    def make_plot(self, maxval):
+
+        color_mapper = LogColorMapper(palette=PALETTE, low=0, high=maxval)
+
+        color_bar = ColorBar(
+            color_mapper=color_mapper,
+            ticker=BasicTicker(),
+            label_standoff=12,
+            border_line_color=None,
+            location=(0, 0),
+        )
+
+        self.p = figure(
+            toolbar_location="left",
+            tooltips=self.tooltips,
+            width=1000,
+            aspect_ratio=1.8,
+        )
+
+        self.p.patches(
             source=self.src,
-            x="date",
-            y="cases",
-            line_width=2,
-            color=colors[0],
-            legend_label="Cases",
+            xs="lons",
+            ys="lats",
+            fill_color="color",
+            line_color="white",
+            line_width=0.5,
+        )
+
+        self.p.axis.visible = False
+        self.p.grid.visible = False
+        self.p.outline_line_color = None
+
+        self.p.add_layout(color_bar, "right")
+
+        self.p.x_range.on_change("start", self.update_geometry)
+        self.p.x_range.on_change("end", self.update_geometry)
+
+    def update_geometry(self, attr, old, new):
+
+        x_range = self.p.x_range
+        if x_range.start is None or x_range.end is None:
+            span = None
+        else:
+            span = x_range.end - x_range.start
+
+        level = select_geometry_level(span, self.p.width)
+
+        if level != self.level:
+            self.level = level
+            lons, lats = self.geometry["levels"][level]
+            self.src.data.update(lons=lons, lats=lats)
+
+    def update(self, attr, old, new):
+
+        label, maxval, data = self.make_dataset()
+
+        if self.src is None:
+            self.src = ColumnDataSource(data)
+            self.make_plot(maxval)
+        else:
+            update_source(self.src, data)
+
+        strdate = date.fromisoformat(self.date.value).strftime("%B %d, %Y")
+        self.p.title.text = f"{label} on {strdate}"
+
+        self.p.right[0].color_mapper.high = maxval
+
+        data_type = self.data_getter.labels[self.data_getter.active].lower()
+        self.constant_date.visible = data_type in (
+            "constant positivity",
+            "constant testing",
+        )
+
+    def animate_update(self):
+
+        self.counter += 1
+
+        if self.save_files.active == [0]:
+            filename = os.path.join(
+                self.tempdir,
+                f"{self.__class__.__name__}_plot_{self.counter}.png",
+            )
+            from bokeh.io import export_png
+
+            export_png(self.p, filename=filename)
+            self.filenames.append(filename)
+
+        new_date = date.fromisoformat(self.date.value) + timedelta(days=1)
+
+        self.date.value = new_date.isoformat()
+
+        if new_date > self.date.enabled_dates[0][1] - timedelta(days=1):
+            self.button.active = False
+
+    def animate(self, attr, old, new):
+
+        if new:
+
+            self.button.label = "❚❚ Pause"
+
+            self.counter = 0
+
+            if self.save_files.active == [0]:
+                self.tempdir = tempfile.mkdtemp()
+                self.filenames = []
+
+            self.callback = curdoc().add_periodic_callback(
+                self.animate_update, 200
+            )
+
+        else:
+
+            self.button.label = "► Play"
+
+            curdoc().remove_periodic_callback(self.callback)
+
+            if self.save_files.active == [0]:
+                import imageio
+
+                with imageio.get_writer(
+                    f"{self.__class__.__name__}_plot.gif", mode="I"
+                ) as writer:
+                    for filename in self.filenames:
+                        image = imageio.imread(filename)
+                        writer.append_data(image)
+                shutil.rmtree(self.tempdir)
+
+    def run(self):
+
+        self.per_capita.on_change("active", self.update)
+        self.data_getter.on_change("active", self.update)
+        self.date.on_change("value", self.update)
+        self.window.on_change("active", self.update)
+        self.constant_date.on_change("value", self.update)
+        self.button.on_change("active", self.animate)
+
+        self.update(None, None, None)
+
+        controls = column(
+            [
+                self.per_capita,
+                self.data_getter,
+                self.date,
+                self.window,
+                self.constant_date,
+                self.save_files,
+                self.button,
+            ],
+            sizing_mode="fixed",
+            width=300,
+            height=600,
+        )
+
+        return row(controls, self.p)
+
+
+class StateMap(MapBase):
+    def __init__(self):
+
+        super().__init__()
+
+        self.data_getter.labels = [
+            "Cases",
+            "Deaths",
+            "Positivity",
+            "Constant Positivity",
+            "Constant Testing",
+            "Weekly Growth",
+            "Projected Cases",
+        ]
+
+        self.tooltips = [
+            ("State", "@state"),
+            ("Value", "@value"),
+            ("Doubling Time (days)", "@doubling"),
+        ]
+
+        self.geometry = load_geometry("states", read_state_shapes)
+
+        self.tracking_rows = None
+        self.case_rows = None
+        self.populations = np.array(
+            [population(name) for name in self.geometry["names"]]
+        )
+
+        self.bind(current_store())
+
+    def bind(self, store):
+
+        super().bind(store)
+
+        self.tracking_rows = np.array(
+            [
+                store.tracking.index.get(code.upper(), -1)
+                for code in self.geometry["codes"]
+            ]
+        )
+        self.case_rows = np.array(
+            [
+                store.cases.index.get(name, -1)
+                for name in self.geometry["names"]
+            ]
+        )
+
+    def make_dataset(self):
+
+        per_capita = self.per_capita.active == 1
+        data_type = self.data_getter.labels[self.data_getter.active].lower()
+        date = self.date.value
+        window = ROLLING_WINDOWS[self.window.active]
+
+        if data_type in ("cases", "deaths"):
+
+            store = self.store.cases
+
+            values = store.average_at(data_type, window, store.position(date))
+
+            if not per_capita:
+                label = f"Total New {data_type.title()}"
+            else:
+                values = values / store.populations * 100000
+                label = f"New {data_type.title()} per 100,000"
+
+            values = np.where(
+                self.case_rows >= 0, values[self.case_rows], np.nan
+            )
+            data = np.where(np.isnan(values), 0, np.maximum(values, 0))
+
+            maxval = store.max_average(data_type, window, per_capita, "state")
+
+        elif data_type == "weekly growth":
+
+            label = "Weekly Growth (%)"
+            values, _ = self.growth_at(self.case_rows, window, date)
+            data = np.where(np.isnan(values), 0, np.maximum(values, 0))
+
+            maxval = GROWTH_MAX
+
+        elif data_type == "projected cases":
+
+            label, values = self.projection_at(
+                self.case_rows, window, date, per_capita
+            )
+            data = np.where(np.isnan(values), 0, np.maximum(values, 0))
+
+            maxval = self.store.cases.max_average(
+                "cases", window, per_capita, "state"
+            )
+
+        else:
+
+            store = self.store.tracking
+
+            if data_type == "positivity":
+                label = "Positivity (%)"
+                values = store["positivity"]
+            elif data_type == "constant positivity":
+                label = "Projected New Cases (Constant Positivity)"
+                values = constant_positivity_projection(
+                    store, self.constant_date.value, window
+                )
+            else:
+                label = "Projected New Cases (Constant Testing)"
+                values = constant_testing_projection(
+                    store, self.constant_date.value, window
+                )
+
+            values = np.where(
+                self.tracking_rows[:, None] >= 0,
+                values[self.tracking_rows],
+                np.nan,
+            )
+
+            if data_type != "positivity" and per_capita:
+                label = label.replace("New Cases", "New Cases per 100,000")
+                values = values / self.populations[:, None] * 100000
+
+            col = store.position(date)
+            if col is not None:
+                data = np.where(
+                    np.isnan(values[:, col]), 0, np.maximum(values[:, col], 0)
+                )
+            else:
+                data = np.zeros(len(self.geometry["names"]))
+
+            finite = values[np.isfinite(values)]
+            maxval = finite.max() if len(finite) else 0
+            if maxval <= 0:
+                maxval = 1
+
+        interp = (
+            compute_log_palette  # if logarithmic else compute_linear_palette
         )
-        self.p.line(
-            source=self.src,
-            x="date",
-            y="deaths",
-            line_width=2,
-            color=colors[1],
-            legend_label="Deaths",
+
+        _, doubling = self.growth_at(self.case_rows, window, date)
+
+        lons, lats = self.geometry["levels"][self.level]
+
+        color_data = {
+            "color": [
+                interp(PALETTE, maxval / 256, maxval, val) for val in data
+            ],
+            "value": data,
+            "doubling": doubling,
+            "state": self.geometry["names"],
+            "lons": lons,
+            "lats": lats,
+        }
+
+        return label, maxval, color_data
+
+
+class CountyMap(MapBase):
+    def __init__(self):
+
+        super().__init__()
+
+        self.data_getter.labels = [
+            "Cases",
+            "Deaths",
+            "Weekly Growth",
+            "Neighbourhood Cases",
+            "Projected Cases",
+        ]
+
+        self.geometry = load_geometry("counties", read_county_shapes)
+
+        self.case_rows = None
+        self.neighbour_rows = None
+
+        self.bind(current_store())
+
+        self.tooltips = [
+            ("Name", "@name"),
+            ("Cases", "@cases"),
+            ("Deaths", "@deaths"),
+            ("Cases per Cap", "@cases_pc"),
+            ("Deaths per Cap", "@deaths_pc"),
+            ("Weekly Growth (%)", "@growth"),
+            ("Doubling Time (days)", "@doubling"),
+            ("Neighbourhood Cases per Cap", "@neighbourhood_pc"),
+            ("Pop", "@population"),
+        ]
+
+    def bind(self, store):
+
+        super().bind(store)
+
+        self.neighbour_rows = None
+
+        self.case_rows = np.array(
+            [
+                store.cases.index.get(", ".join(parse_detailed_name(name)), -1)
+                for name in self.geometry["names"]
+            ]
         )
-        self.p.line(
-            source=self.src,
-            x="date",
-            y="ratio",
-            line_width=2,
-            y_range_name="ratio_axis",
-            color=colors[2],
-            legend_label="Deaths/Cases",
+
+    def make_dataset(self):
+
+        per_capita = self.per_capita.active == 1
+        data_type = self.data_getter.labels[self.data_getter.active].lower()
+        date = self.date.value
+
+        window = ROLLING_WINDOWS[self.window.active]
+
+        store = self.store.cases
+        col = store.position(date)
+
+        rows = self.case_rows
+        found = rows >= 0
+
+        cases = np.where(
+            found, store.average_at("cases", window, col)[rows], 0
+        )
+        deaths = np.where(
+            found, store.average_at("deaths", window, col)[rows], 0
         )
+        pop = np.where(found, np.nan_to_num(store.populations[rows]), 0)
+        cases_pc = np.divide(
+            cases * 100000, pop, out=np.zeros_like(cases), where=pop > 0
+        )
+        deaths_pc = np.divide(
+            deaths * 100000, pop, out=np.zeros_like(deaths), where=pop > 0
+        )
+        pop = pop.astype(int)
+        growth, doubling = self.growth_at(rows, window, date)
 
-        self.p.legend.location = "top_left"
+        if data_type == "neighbourhood cases":
+            neighbourhood, neighbourhood_pc = self.neighbourhood_at(
+                window, col
+            )
+        else:
+            neighbourhood = neighbourhood_pc = np.full(len(rows), np.nan)
+
+        if data_type == "weekly growth":
+            label = "Weekly Growth (%)"
+            values = growth
+        elif data_type == "projected cases":
+            label, values = self.projection_at(rows, window, date, per_capita)
+        elif data_type == "neighbourhood cases":
+            if not per_capita:
+                label = "Total New Neighbourhood Cases"
+                values = neighbourhood
+            else:
+                label = "New Neighbourhood Cases per 100,000"
+                values = neighbourhood_pc
+        elif not per_capita:
+            label = f"Total New {data_type.title()}"
+            values = cases if data_type == "cases" else deaths
+        else:
+            label = f"New {data_type.title()} per 100,000"
+            values = cases_pc if data_type == "cases" else deaths_pc
 
-        self.logp = figure(
-            x_axis_label="Date",
-            x_axis_type="datetime",
-            y_axis_label="Total Cases and Deaths",
-            y_axis_type="log",
-            width=900,
+        data = np.where(np.isnan(values), 0, np.maximum(values, 0))
+
+        if data_type == "weekly growth":
+            maxval = GROWTH_MAX
+        elif per_capita and data_type != "deaths":
+            maxval = 1000
+        elif data_type == "neighbourhood cases":
+            maxval = self.store.neighbourhood().max_average("cases", window)
+        elif data_type == "projected cases":
+            maxval = store.max_average("cases", window, False, "county")
+        else:
+            maxval = store.max_average(data_type, window, per_capita, "county")
+
+        interp = (
+            compute_log_palette  # if logarithmic else compute_linear_palette
         )
 
-        self.logp.extra_y_ranges = {"ratio_axis": Range1d()}
+        lons, lats = self.geometry["levels"][self.level]
 
-        logaxis = LogAxis(y_range_name="ratio_axis")
-        logaxis.formatter = NumeralTickFormatter(format="0 %")
-        self.logp.add_layout(logaxis, "right")
+        color_data = {
+            "color": [
+                interp(PALETTE, maxval / 256, maxval, val) for val in data
+            ],
+            "value": data,
+            "cases": cases,
+            "deaths": deaths,
+            "cases_pc": cases_pc,
+            "deaths_pc": deaths_pc,
+            "growth": growth,
+            "doubling": doubling,
+            "neighbourhood_pc": neighbourhood_pc,
+            "population": pop,
+            "name": self.geometry["names"],
+            "lons": lons,
+            "lats": lats,
+        }
 
-        self.logp.line(
-            source=self.src,
-            x="date",
-            y="cases",
-            line_width=2,
-            color=colors[0],
-            legend_label="Cases",
+        return label, maxval, color_data
+
+    def neighbourhood_at(self, window, col):
+
+        store = self.store.neighbourhood()
+
+        if self.neighbour_rows is None:
+            self.neighbour_rows = np.array(
+                [
+                    store.index.get(self.store.cases.regions[row], -1)
+                    if row >= 0
+                    else -1
+                    for row in self.case_rows
+                ]
+            )
+
+        rows = self.neighbour_rows
+        found = rows >= 0
+
+        cases = np.where(
+            found, store.average_at("cases", window, col)[rows], np.nan
         )
-        self.logp.line(
-            source=self.src,
-            x="date",
-            y="deaths",
-            line_width=2,
-            color=colors[1],
-            legend_label="Deaths",
+        pop = np.where(found, store.populations[rows], np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cases_pc = np.where(pop > 0, cases / pop * 100000, np.nan)
+
+        return cases, cases_pc
+
+
+class PreprocessReport:
+    def __init__(self, trace_memory=False):
+
+        self.trace_memory = trace_memory
+        self.generation = None
+        self.started = datetime.now()
+        self.steps = []
+
+    @contextmanager
+    def step(self, table, name):
+
+        record = {"table": table, "step": name, "rows": None}
+
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            record["peak_bytes"] = (
+                tracemalloc.get_traced_memory()[1]
+                if self.trace_memory
+                else None
+            )
+            record["rows_per_second"] = (
+                record["rows"] / record["seconds"]
+                if record["rows"] and record["seconds"]
+                else None
+            )
+            self.steps.append(record)
+
+    def durations(self):
+
+        durations = dict()
+        for record in self.steps:
+            if record["table"] in STAGES:
+                durations[record["table"]] = (
+                    durations.get(record["table"], 0) + record["seconds"]
+                )
+
+        return durations
+
+    def write(self, filename):
+
+        with open(f"{filename}.tmp", "w") as fileobj:
+            json.dump(
+                {
+                    "generation": self.generation,
+                    "started": self.started.isoformat(timespec="seconds"),
+                    "seconds": sum(record["seconds"] for record in self.steps),
+                    "steps": self.steps,
+                },
+                fileobj,
+                indent=2,
+            )
+        os.replace(f"{filename}.tmp", filename)
+
+    def summary(self):
+
+        lines = [
+            f"{'table':<10} {'step':<12} {'seconds':>8} {'rows':>9} "
+            f"{'rows/s':>10} {'peak MB':>8} {'output MB':>9}"
+        ]
+
+        for record in self.steps:
+            rows = "-" if record["rows"] is None else f"{record['rows']}"
+            rate = record["rows_per_second"]
+            rate = "-" if rate is None else f"{rate:.0f}"
+            output = record.get("output_bytes")
+            output = "-" if output is None else f"{output / 2 ** 20:.1f}"
+            peak = record["peak_bytes"]
+            peak = "-" if peak is None else f"{peak / 2 ** 20:.1f}"
+            lines.append(
+                f"{record['table']:<10} {record['step']:<12} "
+                f"{record['seconds']:>8.2f} {rows:>9} {rate:>10} "
+                f"{peak:>8} {output:>9}"
+            )
+
+        return "\n".join(lines)
+
+
+def drop_states(data, states):
+    return data.drop(data[data["state"].isin(states)].index)
+
+
+def preprocess_states(output, report):
+
+    global GH_STATES_DATA
+
+    with report.step("states", "read") as record:
+        GH_STATES_DATA = pd.read_csv(
+            os.path.join("covid-19-data", "us-states.csv"),
+            parse_dates=["date"],
         )
-        self.logp.line(
-            source=self.src,
-            x="date",
-            y="ratio",
-            line_width=2,
-            y_range_name="ratio_axis",
-            color=colors[2],
-            legend_label="Deaths/Cases",
+        record["rows"] = len(GH_STATES_DATA)
+
+    with report.step("states", "drop") as record:
+        GH_STATES_DATA = drop_states(GH_STATES_DATA, DROP_STATES)
+        record["rows"] = len(GH_STATES_DATA)
+
+    with report.step("states", "compute") as record:
+        compute_states_data()
+        record["rows"] = len(GH_STATES_DATA)
+
+    with report.step("states", "write") as record:
+        write_output(GH_STATES_DATA, output)
+        record["rows"] = len(GH_STATES_DATA)
+        record["output_bytes"] = os.path.getsize(output)
+
+
+def preprocess_counties(output, report):
+
+    global GH_COUNTIES_DATA
+
+    with report.step("counties", "read") as record:
+        GH_COUNTIES_DATA = pd.read_csv(
+            os.path.join("covid-19-data", "us-counties.csv"),
+            parse_dates=["date"],
         )
+        record["rows"] = len(GH_COUNTIES_DATA)
 
-        self.p.legend.location = "top_left"
+    with report.step("counties", "drop") as record:
+        GH_COUNTIES_DATA = drop_states(GH_COUNTIES_DATA, DROP_COUNTIES)
+        record["rows"] = len(GH_COUNTIES_DATA)
 
-    def update(self, attr, old, new):
+    with report.step("counties", "compute") as record:
+        compute_counties_data()
+        record["rows"] = len(GH_COUNTIES_DATA)
 
-        label, new_src = self.make_dataset(self.state)
+    with report.step("counties", "write") as record:
+        write_output(GH_COUNTIES_DATA, output)
+        record["rows"] = len(GH_COUNTIES_DATA)
+        record["output_bytes"] = os.path.getsize(output)
 
-        self.update_data(label, new_src)
 
-        self.p.extra_y_ranges["ratio_axis"].start = 0.0
-        self.p.extra_y_ranges["ratio_axis"].end = 0.4
+def preprocess_nnl(output, report):
 
-        self.logp.extra_y_ranges["ratio_axis"].start = 0.001
-        self.logp.extra_y_ranges["ratio_axis"].end = 1.0
+    global NNL_DATA
 
-        self.p.right[0].axis_label = "Deaths/Cases Ratio"
-        self.logp.right[0].axis_label = "Deaths/Cases Ratio"
+    with report.step("nnl", "read") as record:
+        NNL_DATA = pd.read_csv("nnl-covid.csv", parse_dates=["date"])
+        record["rows"] = len(NNL_DATA)
+
+    with report.step("nnl", "compute") as record:
+        compute_nnl_data()
+        record["rows"] = len(NNL_DATA)
+
+    with report.step("nnl", "write") as record:
+        write_output(NNL_DATA, output)
+        record["rows"] = len(NNL_DATA)
+        record["output_bytes"] = os.path.getsize(output)
+
+
+def preprocess_tracking(output, report):
+
+    with report.step("tracking", "read") as record:
+        data = read_tracking_payload()
+        record["rows"] = len(data)
+
+    with report.step("tracking", "compute") as record:
+        data = compute_tracking_data(data)
+        record["rows"] = len(data)
+
+    with report.step("tracking", "write") as record:
+        write_output(data, output)
+        record["rows"] = len(data)
+        record["output_bytes"] = os.path.getsize(output)
+
+
+STAGES = {
+    "states": (
+        (os.path.join("covid-19-data", "us-states.csv"), "pop_data.csv"),
+        "us-states.csv",
+        preprocess_states,
+        (ROLLING_DAYS, DROP_STATES),
+    ),
+    "counties": (
+        (os.path.join("covid-19-data", "us-counties.csv"), "pop_data.csv"),
+        "us-counties.csv",
+        preprocess_counties,
+        (ROLLING_DAYS, DROP_COUNTIES, EMPTY_COUNTIES, REPLACE_COUNTIES),
+    ),
+    "nnl": (
+        ("nnl-covid.csv", "nnl-sites.csv"),
+        "nnl-detailed.csv",
+        preprocess_nnl,
+        (NNL_ROLLING_DAYS, NNL_POP),
+    ),
+    "tracking": ((TRACKING_FILE,), "us-tracking.csv", preprocess_tracking, ()),
+}
 
-    def update_selection(self, event):
-        self.state = event.item
-        self.state_selection.label = self.state
-        self.update(None, None, None)
 
-    def run(self):
+def file_digest(filename):
 
-        self.state_selection.on_click(self.update_selection)
-        self.plot_type.on_change("active", self.update)
+    digest = hashlib.sha1()
 
-        controls = column(
-            [self.state_selection, self.plot_type],
-            sizing_mode="fixed",
-            width=300,
-            height=600,
-        )
+    with open(filename, "rb") as fileobj:
+        for chunk in iter(partial(fileobj.read, 2 ** 20), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def stage_fingerprint(name):
+
+    sources, output, stage, config = STAGES[name]
+
+    digest = hashlib.sha1(repr((PREPROCESS_VERSION, name, config)).encode())
+    for source in sources:
+        digest.update(file_digest(source).encode())
+
+    return digest.hexdigest()
+
+
+def cached_output(name, fingerprint):
+    return os.path.join(OUTPUT_DIR, f"{fingerprint}-{STAGES[name][1]}")
+
+
+def install_outputs(fingerprints):
+
+    for name, fingerprint in fingerprints.items():
+
+        output = STAGES[name][1]
+        cached = cached_output(name, fingerprint)
+        if os.path.exists(output) and os.path.samefile(output, cached):
+            continue
+
+        if os.path.exists(f"{output}.tmp"):
+            os.remove(f"{output}.tmp")
+
+        try:
+            os.link(cached, f"{output}.tmp")
+        except OSError:
+            shutil.copyfile(cached, f"{output}.tmp")
+        os.replace(f"{output}.tmp", output)
+
+
+def preprocess(trace_memory=False):
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    tracing = not trace_memory or tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+
+    report = PreprocessReport(trace_memory)
+
+    try:
+        if not os.path.exists(TRACKING_FILE):
+            with report.step("tracking", "fetch"):
+                fetch_tracking_data()
+
+        with report.step("all", "fingerprint"):
+            fingerprints = {name: stage_fingerprint(name) for name in STAGES}
+
+        for name, (sources, output, stage, config) in STAGES.items():
+            cached = cached_output(name, fingerprints[name])
+            if not os.path.exists(cached):
+                stage(cached, report)
+
+        install_outputs(fingerprints)
+
+        report.generation = read_generation()
+        if read_manifest(report.generation) != fingerprints:
+            with report.step("all", "publish"):
+                report.generation = publish_generation(fingerprints)
+            report.write(REPORT_FILE)
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+
+    return report.generation, report
+
+
+def read_stage_input(name):
+
+    if name == "nnl":
+        return pd.read_csv("nnl-covid.csv", parse_dates=["date"])
+
+    data = pd.read_csv(
+        os.path.join("covid-19-data", f"us-{name}.csv"), parse_dates=["date"]
+    )
+
+    return drop_states(
+        data, DROP_STATES if name == "states" else DROP_COUNTIES
+    )
+
+
+def run_compute(name, data, backend):
+
+    global GH_STATES_DATA, GH_COUNTIES_DATA, NNL_DATA
+
+    if name == "states":
+        GH_STATES_DATA = data.copy()
+        compute_states_data(backend)
+        return GH_STATES_DATA
+
+    if name == "counties":
+        GH_COUNTIES_DATA = data.copy()
+        compute_counties_data(backend)
+        return GH_COUNTIES_DATA
+
+    NNL_DATA = data.copy()
+    compute_nnl_data(backend)
+    return NNL_DATA
+
+
+def differing_columns(expected, actual):
+
+    if list(expected.columns) != list(actual.columns):
+        return ["<columns>"]
+
+    if not expected.index.equals(actual.index):
+        return ["<index>"]
+
+    differing = []
+    for name in expected.columns:
+        if pd.api.types.is_float_dtype(expected[name]):
+            same = np.allclose(
+                expected[name].values,
+                actual[name].values,
+                rtol=BACKEND_TOLERANCE,
+                atol=BACKEND_TOLERANCE,
+                equal_nan=True,
+            )
+        else:
+            same = expected[name].equals(actual[name])
+        if not same:
+            differing.append(name)
+
+    return differing
+
+
+def compare_backends():
+
+    print(f"{'stage':<10} {'backend':<8} {'rows':>9} {'seconds':>8}  result")
+
+    failed = False
+    for name in ("states", "counties", "nnl"):
+
+        data = read_stage_input(name)
+        expected = None
+
+        for backend in COMPUTE_BACKENDS:
+
+            try:
+                compute_backend(backend)
+            except ImportError:
+                print(f"{name:<10} {backend:<8} {'-':>9} {'-':>8}  missing")
+                continue
+
+            start = time.perf_counter()
+            result = run_compute(name, data, backend)
+            seconds = time.perf_counter() - start
+
+            if expected is None:
+                expected = result
+                status = "reference"
+            else:
+                differing = differing_columns(expected, result)
+                if differing:
+                    status = "differs in " + ", ".join(differing)
+                else:
+                    status = "ok"
+                failed = failed or bool(differing)
+
+            print(
+                f"{name:<10} {backend:<8} {len(result):>9} "
+                f"{seconds:>8.2f}  {status}"
+            )
+
+    return not failed
+
+
+def file_signature(filename):
+
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+
+    return stat.st_mtime_ns, stat.st_size
 
-        self.update_selection(MenuItemClick(None, self.state))
 
-        plots = column(self.p, self.logp)
+def stage_signatures():
 
-        return row(controls, plots, sizing_mode="stretch_both")
+    return {
+        name: tuple(file_signature(source) for source in sources)
+        for name, (sources, output, stage, config) in STAGES.items()
+    }
 
 
-class CountyDisplay(StateDisplay):
-    def __init__(self):
+def watch(interval):
 
-        super().__init__(COUNTIES)
+    if hasattr(os, "nice"):
+        os.nice(10)
 
-        self.state_selection.title = "Counties:"
-        self.state_selection.value = ["New York, Washington", "Texas, Harris"]
+    seen = stage_signatures()
+    pending = set(STAGES)
+    candidates = set()
 
-        self.data_getter.labels = ["Cases", "Deaths"]
+    while True:
 
-        self.tooltips = [("County", "@state")]
+        if pending:
+            previous = read_generation()
+            try:
+                generation, report = preprocess()
+            except Exception:
+                traceback.print_exc()
+            else:
+                if generation != previous:
+                    print(
+                        f"{datetime.now():%Y-%m-%d %H:%M:%S} "
+                        f"published generation {generation}"
+                    )
+                    for name, seconds in report.durations().items():
+                        print(f"    {name}: {seconds:.1f} s")
 
+        time.sleep(interval)
 
-class NNLDisplay(StateDisplay):
-    def __init__(self):
+        signatures = stage_signatures()
+        changed = {name for name in STAGES if signatures[name] != seen[name]}
+        seen = signatures
 
-        sites = list(NNL_DATA["site"].unique())
-        sites += [
-            "New York, Schenectady",
-            "Pennsylvania, Allegheny",
-            "New York, Saratoga",
-            "Idaho, Bonneville",
-            "South Carolina, Berkeley",
-        ]
+        pending = candidates - changed
+        candidates = (candidates | changed) - pending
 
-        super().__init__(sorted(sites))
 
-        self.state_selection.title = "Locations:"
-        self.state_selection.value = [
-            "NNL Knolls",
-            "NNL Bettis",
-            "New York, Schenectady",
-            "Pennsylvania, Allegheny",
-        ]
+def series_frame(store, region, per_capita, data_type, constant_date, window):
 
-        self.data_getter.labels = ["Cases"]
+    (
+        dates,
+        avg_dates,
+        data,
+        avg_data,
+        test_data,
+        label,
+        tot_positive,
+        tot_testing,
+    ) = get_data(
+        region, per_capita, data_type, constant_date, window, data_store=store
+    )
 
-        self.tooltips = [("Location", "@state")]
+    columns = {
+        "date": dates.values,
+        "data": np.asarray(data, dtype=float),
+        "avg_date": avg_dates.values,
+        "avg_data": np.asarray(avg_data, dtype=float),
+    }
+    if test_data is not None:
+        columns["test_data"] = np.asarray(test_data, dtype=float)
 
+    return label, columns
 
-class MapBase:
-    def __init__(self):
 
-        self.per_capita = RadioGroup(
-            labels=["Total", "Per Capita", "Logarithmic"],
-            active=0,
-            sizing_mode="stretch_width",
-        )
-        self.data_getter = RadioGroup(
-            labels=["Cases", "Deaths", "Positivity"],
-            active=0,
-            sizing_mode="stretch_width",
-        )
-        self.date = DatePicker(title="Date", sizing_mode="stretch_width")
-        self.save_files = CheckboxGroup(
-            labels=["Save files"], sizing_mode="stretch_width"
-        )
-        self.button = Button(label="► Play", sizing_mode="stretch_width")
+def map_frame(store, kind, per_capita, data_type, date, window):
 
-        self.tooltips = [("Name", "@name"), ("Value", "@value")]
+    cases = store.cases
+    rows = np.flatnonzero(cases.kinds == kind)
+    col = cases.position(date)
 
-        self.src = None
-        self.p = None
+    if data_type == "weekly growth":
+        label = "Weekly Growth (%)"
+        if col is None:
+            values = np.full(len(rows), np.nan)
+        else:
+            rates = cases.growth("cases", window)["rate"][rows, col]
+            values = np.expm1(7 * rates) * 100
+    else:
+        label = f"Total New {data_type.title()}"
+        values = cases.average_at(data_type, window, col)[rows]
+        if per_capita:
+            label = per_capita_label(label)
+            values = values / cases.populations[rows] * 100000
+
+    return label, {
+        "region": np.array([cases.regions[row] for row in rows], dtype=object),
+        "value": values,
+    }
 
-        self.callback = None
-        self.counter = None
 
-        self.tempdir = None
-        self.filenames = None
+def ranking_frame(store, metric, date, window, count):
 
-    def make_dataset(self):
-        raise NotImplementedError
+    names, values = store.ranking(metric, window).top(
+        store.cases.position(date), count
+    )
 
-    def make_plot(self, maxval):
+    label = next(
+        label for label in RANKING_METRICS if label.lower() == metric
+    )
 
-        color_mapper = LinearColorMapper(palette=PALETTE, low=0, high=maxval)
+    return label, {
+        "region": np.array(names, dtype=object),
+        "value": values,
+    }
 
-        color_bar = ColorBar(
-            color_mapper=color_mapper,
-            ticker=BasicTicker(),
-            label_standoff=12,
-            border_line_color=None,
-            location=(0, 0),
-        )
 
-        self.p = figure(
-            toolbar_location="left",
-            tooltips=self.tooltips,
-            width=1000,
-            aspect_ratio=1.8,
-        )
+def json_column(values):
 
-        self.p.patches(
-            source=self.src,
-            xs="lons",
-            ys="lats",
-            fill_color="color",
-            line_color="white",
-            line_width=0.5,
-        )
+    values = np.asarray(values)
 
-        self.p.axis.visible = False
-        self.p.grid.visible = False
-        self.p.outline_line_color = None
+    if values.dtype.kind == "M":
+        return np.datetime_as_string(values, unit="D").tolist()
+    if values.dtype.kind == "f":
+        return [
+            None if np.isnan(value) else value for value in values.tolist()
+        ]
 
-        self.p.add_layout(color_bar, "right")
+    return values.tolist()
 
-    def update(self, attr, old, new):
 
-        label, maxval, new_src = self.make_dataset()
+def encode_frame(generation, label, columns, fmt):
 
-        if self.src is None:
-            self.src = new_src
-            self.make_plot(maxval)
-        else:
-            self.src.data.update(new_src.data)
+    if fmt == "json":
+        return json.dumps(
+            {
+                "generation": generation,
+                "label": label,
+                "columns": {
+                    name: json_column(values)
+                    for name, values in columns.items()
+                },
+            }
+        ).encode()
 
-        strdate = date.fromisoformat(self.date.value).strftime("%B %d, %Y")
-        self.p.title.text = f"{label} on {strdate}"
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise HTTPError(406, "pyarrow is not installed, use format=json")
+
+    table = pa.table(
+        {name: np.asarray(values) for name, values in columns.items()}
+    ).replace_schema_metadata(
+        {"generation": str(generation), "label": label}
+    )
 
-        color_mapper = LogColorMapper
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
 
-        self.p.right[0].color_mapper = color_mapper(
-            palette=PALETTE, low=0, high=maxval
-        )
-        self.p.right[0].ticker = BasicTicker()
+    return sink.getvalue().to_pybytes()
 
-    def animate_update(self):
 
-        self.counter += 1
+class DataHandler(RequestHandler):
+    def initialize(self):
 
-        if self.save_files.active == [0]:
-            filename = os.path.join(
-                self.tempdir,
-                f"{self.__class__.__name__}_plot_{self.counter}.png",
-            )
-            export_png(self.p, filename=filename)
-            self.filenames.append(filename)
+        self.etag = None
 
-        new_date = date.fromisoformat(self.date.value) + timedelta(days=1)
+    def parse_bool(self, name):
+        return self.get_argument(name, "0").lower() in ("1", "true", "yes")
 
-        self.date.value = new_date.isoformat()
+    def parse_choice(self, name, choices, default):
 
-        if new_date > self.date.enabled_dates[0][1] - timedelta(days=1):
-            self.animate()
+        value = self.get_argument(name, default).lower()
+        if value not in choices:
+            raise HTTPError(400, f"{name} must be one of {', '.join(choices)}")
 
-    def animate(self):
+        return value
 
-        if self.button.label == "► Play":
+    def parse_window(self):
 
-            self.button.label = "❚❚ Pause"
+        try:
+            window = int(self.get_argument("window", str(ROLLING_DAYS)))
+        except ValueError:
+            window = None
 
-            self.counter = 0
+        if window not in ROLLING_WINDOWS:
+            windows = ", ".join(map(str, ROLLING_WINDOWS))
+            raise HTTPError(400, f"window must be one of {windows}")
 
-            if self.save_files.active == [0]:
-                self.tempdir = tempfile.mkdtemp()
-                self.filenames = []
+        return window
 
-            self.callback = curdoc().add_periodic_callback(
-                self.animate_update, 200
-            )
+    def parse_date(self, name, default=None):
 
-        else:
+        value = self.get_argument(name, None)
+        if value is None:
+            return default
 
-            self.button.label = "► Play"
+        try:
+            return pd.Timestamp(value).date()
+        except ValueError:
+            raise HTTPError(400, f"{name} must be a date")
 
-            curdoc().remove_periodic_callback(self.callback)
+    def params(self, store):
+        raise NotImplementedError
 
-            if self.save_files.active == [0]:
-                with imageio.get_writer(
-                    f"{self.__class__.__name__}_plot.gif", mode="I"
-                ) as writer:
-                    for filename in self.filenames:
-                        image = imageio.imread(filename)
-                        writer.append_data(image)
-                shutil.rmtree(self.tempdir)
+    def frame(self, store, **params):
+        raise NotImplementedError
 
-    def run(self):
+    def compute_etag(self):
+        return self.etag
 
-        self.per_capita.on_change("active", self.update)
-        self.data_getter.on_change("active", self.update)
-        self.date.on_change("value", self.update)
-        self.button.on_click(self.animate)
+    def write_error(self, status_code, **kwargs):
 
-        self.update(None, None, None)
+        error = kwargs.get("exc_info", (None, None))[1]
+        self.finish(
+            {"error": getattr(error, "log_message", None) or self._reason}
+        )
 
-        controls = column(
-            [
-                self.per_capita,
-                self.data_getter,
-                self.date,
-                self.save_files,
-                self.button,
-            ],
-            sizing_mode="fixed",
-            width=300,
-            height=600,
+    def get(self):
+
+        store = current_store()
+        fmt = self.parse_choice("format", API_FORMATS, "json")
+        params = self.params(store)
+
+        key = (store.generation, self.__class__.__name__, fmt) + tuple(
+            sorted(params.items())
         )
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+        self.etag = f'"{store.generation}-{digest}"'
+
+        self.set_header("Content-Type", API_FORMATS[fmt])
+        self.set_header("Cache-Control", "no-cache")
+        self.set_etag_header()
+
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+
+        if key not in API_CACHE:
+            try:
+                label, columns = self.frame(store, **params)
+            except KeyError as error:
+                raise HTTPError(404, f"unknown region {error}")
+
+            if len(API_CACHE) >= API_CACHE_SIZE:
+                del API_CACHE[next(iter(API_CACHE))]
+            API_CACHE[key] = encode_frame(
+                store.generation, label, columns, fmt
+            )
 
-        return row(controls, self.p)
+        self.write(API_CACHE[key])
+
+
+class SeriesHandler(DataHandler):
+    def params(self, store):
+
+        return {
+            "region": self.get_argument("region"),
+            "per_capita": self.parse_bool("per_capita"),
+            "data_type": self.parse_choice(
+                "data_type",
+                (
+                    "cases",
+                    "deaths",
+                    "weekly growth",
+                    "neighbourhood cases",
+                    "testing",
+                    "positivity",
+                    "constant positivity",
+                    "constant testing",
+                ),
+                "cases",
+            ),
+            "constant_date": self.parse_date(
+                "constant_date", (datetime.today() - timedelta(days=1)).date()
+            ),
+            "window": self.parse_window(),
+        }
 
+    def frame(self, store, **params):
+        return series_frame(store, **params)
 
-class StateMap(MapBase):
-    def __init__(self):
 
-        super().__init__()
+class MapHandler(DataHandler):
+    def params(self, store):
 
-        self.tooltips = [("State", "@state"), ("Value", "@value")]
+        kind = self.parse_choice("kind", ("state", "county"), "state")
 
-        dates = GH_STATES_DATA.loc[:, "date"]
-        self.date.value = dates.max().date()
-        self.date.enabled_dates = [(dates.min().date(), dates.max().date())]
+        return {
+            "kind": kind,
+            "per_capita": self.parse_bool("per_capita"),
+            "data_type": self.parse_choice(
+                "data_type", ("cases", "deaths", "weekly growth"), "cases"
+            ),
+            "date": self.parse_date("date", store.date_range(kind)[1]),
+            "window": self.parse_window(),
+        }
 
-    def make_dataset(self):
+    def frame(self, store, **params):
+        return map_frame(store, **params)
 
-        per_capita = self.per_capita.active == 1
-        data_type = self.data_getter.labels[self.data_getter.active].lower()
-        date = self.date.value
 
-        data = np.empty(len(US_STATES))
+class RankingHandler(DataHandler):
+    def params(self, store):
 
-        if data_type in ("cases", "deaths"):
+        try:
+            count = int(self.get_argument("count", str(TOP_COUNTS[-1])))
+        except ValueError:
+            raise HTTPError(400, "count must be an integer")
 
-            if not per_capita:
-                dt_label = data_type
-                label = f"Total New {data_type.title()}"
-            else:
-                dt_label = f"{data_type}_pc"
-                label = f"New {data_type.title()} per 100,000"
+        return {
+            "metric": self.parse_choice(
+                "metric",
+                [metric.lower() for metric in RANKING_METRICS],
+                RANKING_METRICS[0].lower(),
+            ),
+            "date": self.parse_date("date", store.date_range("county")[1]),
+            "window": self.parse_window(),
+            "count": max(count, 0),
+        }
 
-            subset = GH_STATES_DATA.loc[GH_STATES_DATA["date"] == date, :]
-            for i, (abbrv, state) in enumerate(US_STATES.items()):
-                state_name = state["name"]
-                value = subset.loc[
-                    subset["state"] == state_name, f"avg_{dt_label}"
-                ]
-                if not value.empty and not np.isnan(value.values[0]):
-                    data[i] = max(0, value.values[0])
-                else:
-                    data[i] = 0
+    def frame(self, store, **params):
+        return ranking_frame(store, **params)
 
-            maxval = GH_STATES_DATA.loc[:, f"avg_{dt_label}"].max()
 
-        elif data_type == "positivity":
+def make_document(doc):
 
-            label = "Positivity (%)"
+    counties = CountyDisplay()
 
-            subset = TRACKING_DATA.loc[
-                TRACKING_DATA["datetime"] == date, ("state", "positivity")
-            ]
-            for i, (abbrv, state) in enumerate(US_STATES.items()):
-                value = subset.loc[
-                    subset["state"] == abbrv.upper(), "positivity"
-                ]
-                if not value.empty and not np.isnan(value.values[0]):
-                    data[i] = max(0, value.values[0])
-                else:
-                    data[i] = 0
+    displays = {
+        "State Comparisons": StateDisplay(),
+        "County Comparisons": counties,
+        "Top Counties": TopCountiesDisplay(counties),
+        "State Data": SingleStateDisplay(),
+        "County Data": SingleCountyDisplay(),
+        "State Ratio": RatioDisplay(),
+        "State Map": StateMap(),
+        "County Map": CountyMap(),
+        "NNL Comparisons": NNLDisplay(),
+        "NNL Lag Correlation": LagDisplay(),
+    }
 
-            maxval = TRACKING_DATA.loc[:, "positivity"].max()
+    panels = {
+        title: Panel(child=display.run(), title=title)
+        for title, display in displays.items()
+    }
 
-        interp = (
-            compute_log_palette  # if logarithmic else compute_linear_palette
-        )
+    tabs = Tabs(
+        tabs=[
+            panels[title]
+            for title in (
+                "State Data",
+                "County Data",
+                "State Comparisons",
+                "County Comparisons",
+                "Top Counties",
+                "State Ratio",
+                "State Map",
+                "County Map",
+                "NNL Comparisons",
+                "NNL Lag Correlation",
+            )
+        ]
+    )
 
-        color_data = {
-            "color": [
-                interp(PALETTE, maxval / 256, maxval, val) for val in data
-            ],
-            "value": data,
-            "state": [state["name"] for state in US_STATES.values()],
-            "lons": [],
-            "lats": [],
-        }
+    doc.add_root(tabs)
+    doc.on_event(DocumentReady, partial(refine_displays, displays.values()))
 
-        for state in US_STATES.values():
-            color_data["lons"].append(state["lons"])
-            color_data["lats"].append(state["lats"])
+    SESSIONS[doc] = list(displays.values())
 
-        return label, maxval, ColumnDataSource(color_data)
 
+def serve(port):
 
-class CountyMap(MapBase):
-    def __init__(self):
+    from bokeh.application import Application
+    from bokeh.application.handlers.function import FunctionHandler
+    from bokeh.server.server import Server
 
-        super().__init__()
+    current_store()
 
-        dates = GH_COUNTIES_DATA.loc[:, "date"]
-        self.date.value = dates.max().date()
-        self.date.enabled_dates = [(dates.min().date(), dates.max().date())]
+    server = Server(
+        {"/covid": Application(FunctionHandler(make_document))},
+        port=port,
+        extra_patterns=[
+            (r"/api/series", SeriesHandler),
+            (r"/api/map", MapHandler),
+            (r"/api/ranking", RankingHandler),
+        ],
+    )
+    server.start()
 
-        self.data_getter.labels = ["Cases", "Deaths"]
+    PeriodicCallback(
+        lambda: IOLoop.current().add_callback(reload_store), RELOAD_INTERVAL
+    ).start()
 
-        self.tooltips = [
-            ("Name", "@name"),
-            ("Cases", "@cases"),
-            ("Deaths", "@deaths"),
-            ("Cases per Cap", "@cases_pc"),
-            ("Deaths per Cap", "@deaths_pc"),
-            ("Pop", "@population"),
-        ]
+    server.io_loop.start()
 
-    def make_dataset(self):
 
-        per_capita = self.per_capita.active == 1
-        data_type = self.data_getter.labels[self.data_getter.active].lower()
-        date = self.date.value
+def startup_report():
 
-        excluded = ("ak", "hi", "pr", "gu", "vi", "mp", "as")
-        counties = {
-            abbrv: county
-            for abbrv, county in US_COUNTIES.items()
-            if county["state"] not in excluded
-        }
+    timings = {"import": IMPORT_TIME - START_TIME}
 
-        data = np.zeros(len(counties), dtype=float)
-        cases = np.zeros(len(counties), dtype=float)
-        deaths = np.zeros(len(counties), dtype=float)
-        cases_pc = np.zeros(len(counties), dtype=float)
-        deaths_pc = np.zeros(len(counties), dtype=float)
-        pop = np.zeros(len(counties), dtype=int)
+    start = time.perf_counter()
+    store = current_store()
+    timings["data load"] = time.perf_counter() - start
 
-        if not per_capita:
-            dt_label = data_type
-            label = f"Total New {data_type.title()}"
-        else:
-            dt_label = f"{data_type}_pc"
-            label = f"New {data_type.title()} per 100,000"
+    start = time.perf_counter()
+    make_document(Document())
+    timings["first document"] = time.perf_counter() - start
 
-        subset = GH_COUNTIES_DATA.loc[GH_COUNTIES_DATA["date"] == date, :]
-        for i, (abbrv, county) in enumerate(counties.items()):
-            state_name, county_name = parse_detailed_name(
-                county["detailed name"]
-            )
-            value = subset.loc[
-                (subset["county"] == county_name).values
-                & (subset["state"] == state_name).values,
-                :,
-            ]
-            if not value.empty:
-                dataval = value[f"avg_{dt_label}"].values[0]
-                if not np.isnan(dataval):
-                    data[i] = max(0, dataval)
-                else:
-                    data[i] = 0
-                cases[i] = value["avg_cases"].values[0]
-                deaths[i] = value["avg_deaths"].values[0]
-                cases_pc[i] = value["avg_cases_pc"].values[0]
-                deaths_pc[i] = value["avg_deaths_pc"].values[0]
-                pop[i] = population(f"{state_name}, {county_name}")
-
-        if per_capita and data_type != "deaths":
-            maxval = 1000
-        else:
-            maxval = GH_COUNTIES_DATA.loc[:, f"avg_{dt_label}"].max()
+    for name, seconds in timings.items():
+        print(f"{name}: {seconds:.2f} s")
 
-        interp = (
-            compute_log_palette  # if logarithmic else compute_linear_palette
+    shared = store.cases.shared_bytes() + store.tracking.shared_bytes()
+    print(
+        f"memory-mapped store: {shared / 2 ** 20:.1f} MB, "
+        "shared by every worker instead of copied into each"
+    )
+
+    if os.path.exists("/proc/self/smaps_rollup"):
+        with open("/proc/self/smaps_rollup") as fileobj:
+            usage = dict(line.split(":", 1) for line in fileobj if ":" in line)
+        resident = int(usage["Rss"].split()[0])
+        private = sum(
+            int(usage[key].split()[0])
+            for key in ("Private_Clean", "Private_Dirty")
+        )
+        print(
+            f"resident: {resident / 2 ** 10:.1f} MB, "
+            f"private to this process: {private / 2 ** 10:.1f} MB"
         )
 
-        color_data = {
-            "color": [
-                interp(PALETTE, maxval / 256, maxval, val) for val in data
-            ],
-            "value": data,
-            "cases": cases,
-            "deaths": deaths,
-            "cases_pc": cases_pc,
-            "deaths_pc": deaths_pc,
-            "population": pop,
-            "name": [county["detailed name"] for county in counties.values()],
-            "lons": [],
-            "lats": [],
-        }
 
-        for county in counties.values():
-            color_data["lons"].append(county["lons"])
-            color_data["lats"].append(county["lats"])
+def event_report():
 
-        return label, maxval, ColumnDataSource(color_data)
+    from bokeh.protocol import Protocol
 
+    protocol = Protocol()
 
-if __name__ == "__main__":
+    doc = Document()
+    make_document(doc)
 
-    gh_states_data_file = os.path.join("covid-19-data", "us-states.csv")
-    gh_counties_data_file = os.path.join("covid-19-data", "us-counties.csv")
+    events = []
+    doc.on_change(events.append)
 
-    drop_states = [
-        "Guam",
-        "Northern Mariana Islands",
-        "Virgin Islands",
-        "Puerto Rico",
-    ]
-    drop_counties = drop_states + ["Hawaii", "Alaska"]
+    for display in SESSIONS[doc]:
+        for name, widget in vars(display).items():
 
-    GH_STATES_DATA = pd.read_csv(gh_states_data_file, parse_dates=["date"])
-    for state in drop_states:
-        GH_STATES_DATA.drop(
-            GH_STATES_DATA[GH_STATES_DATA["state"] == state].index,
-            inplace=True,
-        )
-    compute_states_data()
-    GH_STATES_DATA.to_csv("us-states.csv")
+            if isinstance(widget, RadioGroup) and len(widget.labels) > 1:
+                value = (widget.active + 1) % len(widget.labels)
+                attr = "active"
+            elif isinstance(widget, CheckboxGroup):
+                value = [] if widget.active else [0]
+                attr = "active"
+            else:
+                continue
+
+            if widget.document is not doc:
+                continue
+
+            events.clear()
+            start = time.perf_counter()
+            setattr(widget, attr, value)
+            seconds = time.perf_counter() - start
+
+            changes = [event for event in events if event.model is not widget]
+            size = 0
+            if changes:
+                message = protocol.create("PATCH-DOC", changes)
+                size = len(message.content_json) + sum(
+                    len(buffer) for _, buffer in message.buffers
+                )
 
-    GH_COUNTIES_DATA = pd.read_csv(gh_counties_data_file, parse_dates=["date"])
-    for state in drop_counties:
-        GH_COUNTIES_DATA.drop(
-            GH_COUNTIES_DATA[GH_COUNTIES_DATA["state"] == state].index,
-            inplace=True,
-        )
-    compute_counties_data()
-    GH_COUNTIES_DATA.to_csv("us-counties.csv")
+            print(
+                f"{display.__class__.__name__}.{name}: "
+                f"{len(changes)} events, {size} bytes, "
+                f"{seconds * 1000:.0f} ms"
+            )
 
-    NNL_DATA = pd.read_csv("nnl-covid.csv", parse_dates=["date"])
-    compute_nnl_data()
-    NNL_DATA.to_csv("nnl-detailed.csv")
 
-    sys.exit(0)
+IMPORT_TIME = time.perf_counter()
+
 
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="serve the dashboard, reloading data when it is refreshed",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="rerun the affected preprocessing stages when inputs change",
+    )
+    parser.add_argument(
+        "--startup-report",
+        action="store_true",
+        help="time import, data load and the first document build",
+    )
+    parser.add_argument(
+        "--event-report",
+        action="store_true",
+        help="count the document events and bytes each widget change sends",
+    )
+    parser.add_argument(
+        "--compare-backends",
+        action="store_true",
+        help="check that every compute backend gives the same tables",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=list(COMPUTE_BACKENDS),
+        default=COMPUTE_BACKEND,
+        help="library used to compute the preprocessed tables",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="trace the peak memory of each preprocessing step",
+    )
+    parser.add_argument(
+        "--fetch-tracking",
+        action="store_true",
+        help="download the current COVID Tracking Project data first",
+    )
+    parser.add_argument(
+        "--rollback",
+        metavar="GENERATION",
+        help="republish the data tables of an earlier generation",
+    )
+    parser.add_argument("--port", type=int, default=5006)
+    parser.add_argument("--interval", type=int, default=WATCH_INTERVAL)
+    args = parser.parse_args()
+
+    COMPUTE_BACKEND = args.backend
+
+    if args.serve:
+        serve(args.port)
+    elif args.watch:
+        watch(args.interval)
+    elif args.startup_report:
+        startup_report()
+    elif args.event_report:
+        event_report()
+    elif args.rollback:
+        rollback(args.rollback)
+    elif args.compare_backends:
+        sys.exit(0 if compare_backends() else 1)
+    else:
+        if args.fetch_tracking:
+            fetch_tracking_data()
+        generation, report = preprocess(args.trace_memory)
+        print(report.summary())
+        print(f"generation {generation}")
 
-tab1 = Panel(child=StateDisplay().run(), title="State Comparisons")
-tab2 = Panel(child=CountyDisplay().run(), title="County Comparisons")
-tab3 = Panel(child=SingleStateDisplay().run(), title="State Data")
-tab4 = Panel(child=SingleCountyDisplay().run(), title="County Data")
-tab5 = Panel(child=RatioDisplay().run(), title="State Ratio")
-tab6 = Panel(child=StateMap().run(), title="State Map")
-tab7 = Panel(child=CountyMap().run(), title="County Map")
-tab8 = Panel(child=NNLDisplay().run(), title="NNL Comparisons")
+    sys.exit(0)
 
-tabs = Tabs(tabs=[tab3, tab4, tab1, tab2, tab5, tab6, tab7, tab8])
 
-curdoc().add_root(tabs)
+if __name__.startswith("bokeh_app_"):
+    make_document(curdoc())
@@ -0,0 +1,225 @@
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+from bokeh.client import pull_session
+from bokeh.models.widgets import MultiSelect, RadioGroup
+
+SESSION_COUNTS = (1, 5, 10, 20)
+ROUNDS = 3
+SCRUB_DAYS = 5
+PLAY_SECONDS = 2
+IDLE_ROUNDTRIPS = 5
+
+
+def start_server(port):
+
+    server = subprocess.Popen(
+        [sys.executable, "covid.py", "--serve", "--port", str(port)]
+    )
+
+    while server.poll() is None:
+        try:
+            socket.create_connection(("localhost", port), timeout=1).close()
+        except OSError:
+            time.sleep(1)
+        else:
+            return server
+
+    raise RuntimeError(f"server exited with code {server.returncode}")
+
+
+def process_usage(pid):
+
+    if pid is None or not os.path.exists(f"/proc/{pid}"):
+        return None, None
+
+    with open(f"/proc/{pid}/stat") as fileobj:
+        fields = fileobj.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    with open(f"/proc/{pid}/status") as fileobj:
+        status = dict(line.split(":", 1) for line in fileobj)
+    rss = int(status["VmRSS"].split()[0]) / 2**10
+
+    return cpu, rss
+
+
+def interactions(session):
+
+    doc = session.document
+
+    counties = doc.select_one({"type": MultiSelect, "title": "Counties:"})
+    per_capita = [
+        model
+        for model in doc.select({"type": RadioGroup})
+        if model.labels[:2] == ["Total", "Per Capita"]
+    ]
+    map_date = doc.select_one({"name": "StateMap.date"})
+    play = doc.select_one({"name": "StateMap.button"})
+
+    steps = [
+        (
+            "select counties",
+            lambda: setattr(counties, "value", list(counties.options[:3])),
+        )
+    ]
+
+    for widget in per_capita:
+        steps.append(
+            ("toggle per capita", lambda widget=widget: toggle(widget))
+        )
+
+    start = np.datetime64(map_date.enabled_dates[0][1]) - SCRUB_DAYS
+    for day in range(SCRUB_DAYS):
+        value = str(start + day)
+        steps.append(
+            (
+                "scrub map date",
+                lambda value=value: setattr(map_date, "value", value),
+            )
+        )
+
+    steps.append(("press play", lambda: setattr(play, "active", True)))
+    steps.append(("wait", lambda: time.sleep(PLAY_SECONDS)))
+    steps.append(("press pause", lambda: setattr(play, "active", False)))
+
+    return steps
+
+
+def toggle(widget):
+    widget.active = 1 - widget.active
+
+
+def run_session(url, rounds, barrier, latencies, idle, errors):
+
+    try:
+        session = pull_session(url=url)
+        steps = interactions(session)
+        for _ in range(IDLE_ROUNDTRIPS):
+            start = time.perf_counter()
+            session.force_roundtrip()
+            idle.append(time.perf_counter() - start)
+    except Exception as error:
+        errors.append(error)
+        barrier.abort()
+        return
+
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        session.close()
+        return
+
+    try:
+        for _ in range(rounds):
+            for name, step in steps:
+                start = time.perf_counter()
+                step()
+                session.force_roundtrip()
+                if name != "wait":
+                    latencies.append(time.perf_counter() - start)
+    except Exception as error:
+        errors.append(error)
+    finally:
+        session.close()
+
+
+def load_test(url, count, rounds, pid):
+
+    latencies = []
+    idle = []
+    errors = []
+    barrier = threading.Barrier(count + 1)
+
+    threads = [
+        threading.Thread(
+            target=run_session,
+            args=(url, rounds, barrier, latencies, idle, errors),
+            daemon=True,
+        )
+        for _ in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        pass
+
+    cpu_start, _ = process_usage(pid)
+    start = time.perf_counter()
+
+    for thread in threads:
+        thread.join()
+
+    wall = time.perf_counter() - start
+    cpu_end, rss = process_usage(pid)
+
+    if errors:
+        raise errors[0]
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    cpu = None if cpu_start is None else (cpu_end - cpu_start) / wall * 100
+
+    return np.median(idle) * 1000, p50, p95, p99, cpu, rss
+
+
+def report(url, counts, rounds, pid):
+
+    print(
+        f"{'sessions':>8} {'idle ms':>8} {'p50 ms':>8} {'p95 ms':>8} "
+        f"{'p99 ms':>8} {'cpu %':>6} {'rss MB':>7}"
+    )
+
+    for count in counts:
+        idle, p50, p95, p99, cpu, rss = load_test(url, count, rounds, pid)
+        cpu = "-" if cpu is None else f"{cpu:.0f}"
+        rss = "-" if rss is None else f"{rss:.0f}"
+        print(
+            f"{count:>8} {idle:>8.1f} {p50:>8.1f} {p95:>8.1f} "
+            f"{p99:>8.1f} {cpu:>6} {rss:>7}"
+        )
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sessions",
+        type=lambda value: [int(count) for count in value.split(",")],
+        default=list(SESSION_COUNTS),
+        help="comma separated numbers of concurrent sessions to try",
+    )
+    parser.add_argument("--rounds", type=int, default=ROUNDS)
+    parser.add_argument("--port", type=int, default=5006)
+    parser.add_argument(
+        "--url", help="test an already running server instead of starting one"
+    )
+    parser.add_argument(
+        "--pid", type=int, help="process id of the server given by --url"
+    )
+    args = parser.parse_args()
+
+    if args.url:
+        report(args.url, args.sessions, args.rounds, args.pid)
+    else:
+        server = start_server(args.port)
+        try:
+            report(
+                f"http://localhost:{args.port}/covid",
+                args.sessions,
+                args.rounds,
+                server.pid,
+            )
+        finally:
+            server.terminate()
+            server.wait()
+
+    sys.exit(0)
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import covid
+
+BACKENDS = ["pandas", "numpy", "polars"]
+
+
+def backend_name(name):
+
+    if name == "polars":
+        pytest.importorskip("polars")
+
+    return name
+
+
+def region_frame(regions, region_column, seed=0):
+
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2020-03-01", periods=60)
+
+    frame = pd.DataFrame(
+        [(date, *region) for date in dates for region in regions],
+        columns=["date", *region_column],
+    )
+    frame = frame.sample(frac=0.9, random_state=seed).reset_index(drop=True)
+
+    frame["cases"] = rng.integers(0, 10000, len(frame)).astype(float)
+    frame["deaths"] = rng.integers(0, 100, len(frame)).astype(float)
+    frame.loc[frame.index[::11], "deaths"] = np.nan
+
+    return frame
+
+
+def run_states(frame, backend):
+
+    covid.GH_STATES_DATA = frame.copy()
+    covid.compute_states_data(backend)
+
+    return covid.GH_STATES_DATA
+
+
+def run_counties(frame, backend):
+
+    covid.GH_COUNTIES_DATA = frame.copy()
+    covid.compute_counties_data(backend)
+
+    return covid.GH_COUNTIES_DATA
+
+
+def run_nnl(frame, backend):
+
+    covid.NNL_DATA = frame.copy()
+    covid.compute_nnl_data(backend)
+
+    return covid.NNL_DATA
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_series(backend):
+
+    rng = np.random.default_rng(1)
+    groups = rng.integers(-1, 5, 500)
+    values = rng.normal(100, 30, 500)
+    values[::17] = np.nan
+
+    expected = covid.compute_backend("pandas").series(groups, values, 7)
+    actual = covid.compute_backend(backend_name(backend)).series(
+        groups, values, 7
+    )
+
+    np.testing.assert_array_equal(expected[0], actual[0])
+    np.testing.assert_allclose(
+        expected[1], actual[1], rtol=covid.BACKEND_TOLERANCE, equal_nan=True
+    )
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_states(backend):
+
+    frame = region_frame(
+        [("Idaho",), ("New York",), ("South Carolina",)], ["state"]
+    )
+
+    expected = run_states(frame, "pandas")
+    actual = run_states(frame, backend_name(backend))
+
+    assert covid.differing_columns(expected, actual) == []
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_counties(backend):
+
+    frame = region_frame(
+        [
+            ("Idaho", "Bonneville"),
+            ("New York", "Schenectady"),
+            ("New York", "Unknown"),
+            ("Pennsylvania", "Allegheny"),
+        ],
+        ["state", "county"],
+    )
+
+    expected = run_counties(frame, "pandas")
+    actual = run_counties(frame, backend_name(backend))
+
+    assert covid.differing_columns(expected, actual) == []
+    assert (
+        expected.loc[expected["county"] == "Unknown", "avg_cases"].isna().all()
+    )
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_nnl(backend):
+
+    rng = np.random.default_rng(2)
+    frame = pd.DataFrame(
+        {"date": pd.date_range("2020-03-01", periods=40, freq="2D")}
+    )
+    for column in covid.NNL_SITES["column"]:
+        frame[column] = np.cumsum(rng.integers(0, 5, len(frame)))
+
+    expected = run_nnl(frame, "pandas")
+    actual = run_nnl(frame, backend_name(backend))
+
+    assert covid.differing_columns(expected, actual) == []
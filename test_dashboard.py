@@ -0,0 +1,165 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import covid
+
+STATES = ["New York", "Idaho"]
+COUNTIES = [
+    ("New York", "Albany"),
+    ("Idaho", "Ada"),
+    ("New York", "Unknown"),
+]
+TRACKING = {"New York": "NY", "Idaho": "ID"}
+
+
+def cumulative_frame(dates, regions, columns, seed=0):
+
+    rng = np.random.default_rng(seed)
+
+    frames = []
+    for i, region in enumerate(regions):
+        frame = pd.DataFrame({"date": dates})
+        for column, name in zip(columns, region):
+            frame[column] = name
+        frame["cases"] = np.cumsum(rng.integers(10, 100, len(dates)) * (i + 1))
+        frame["deaths"] = np.cumsum(rng.integers(0, 5, len(dates)))
+        frames.append(frame)
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def tracking_frame(dates, seed=0):
+
+    rng = np.random.default_rng(seed)
+
+    frames = []
+    for code in TRACKING.values():
+        tests = np.cumsum(rng.integers(1000, 2000, len(dates)))
+        positive = np.cumsum(rng.integers(50, 150, len(dates)))
+        frames.append(
+            pd.DataFrame(
+                {
+                    "date": dates.strftime("%Y%m%d").astype(int),
+                    "state": code,
+                    "positive": positive,
+                    "positiveIncrease": np.diff(positive, prepend=0),
+                    "totalTestResults": tests,
+                    "totalTestResultsIncrease": np.diff(tests, prepend=0),
+                }
+            )
+        )
+
+    return covid.compute_tracking_data(pd.concat(frames, ignore_index=True))
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("dashboard"))
+
+    dates = pd.date_range("2020-06-01", periods=90)
+    states = cumulative_frame(dates, [(name,) for name in STATES], ["state"])
+    counties = cumulative_frame(dates, COUNTIES, ["state", "county"], 1)
+
+    cases = covid.build_case_store(states, counties, None)
+    tracking = covid.build_tracking_store(tracking_frame(dates[:60]))
+
+    covid.STORE = covid.DataStore("test", cases, tracking)
+
+    yield covid.STORE
+
+    covid.STORE = None
+    os.chdir(cwd)
+
+
+@pytest.mark.parametrize("mode", ["Constant Positivity", "Constant Testing"])
+def test_state_map_constant_modes(store, mode):
+
+    display = covid.StateMap()
+    display.run()
+
+    last = store.tracking.dates[-1].date()
+    assert pd.Timestamp(display.constant_date.value).date() == last
+
+    display.data_getter.active = display.data_getter.labels.index(mode)
+
+    values = display.src.data["value"]
+    assert np.isfinite(values).all()
+    assert np.isfinite(display.p.right[0].color_mapper.high)
+
+    display.date.value = last
+
+    assert (display.src.data["value"] > 0).any()
+
+    display.constant_date.value = "2019-01-01"
+
+    assert (display.src.data["value"] == 0).all()
+    assert display.p.right[0].color_mapper.high == 1
+
+
+def test_ranking_skips_unknown_counties(store):
+
+    for metric in covid.RANKING_METRICS:
+        ranking = store.ranking(metric.lower(), covid.ROLLING_DAYS)
+        for col in range(len(store.cases.dates)):
+            names, values = ranking.top(col, len(COUNTIES))
+            assert not any(name.endswith(", Unknown") for name in names)
+
+
+def test_counties_with_missing_days_keep_their_values(store):
+
+    dates = pd.date_range("2020-06-01", periods=30)
+    states = cumulative_frame(dates, [("New York",)], ["state"])
+    counties = cumulative_frame(
+        dates, [("New York", "Albany")], ["state", "county"]
+    )
+    counties = counties.drop(index=[10, 11, 20]).reset_index(drop=True)
+
+    cases = covid.build_case_store(states, counties, None)
+    data_store = covid.DataStore("gaps", cases, store.tracking)
+
+    _, _, daily, average, *_ = covid.get_data(
+        "New York, Albany", data_store=data_store, window=7
+    )
+    expected = counties["cases"].diff()
+
+    np.testing.assert_array_equal(daily.values[1:], expected.values[1:])
+    assert not np.isnan(average.values[7:]).any()
+
+
+def test_single_state_per_capita_toggle(store):
+
+    display = covid.SingleStateDisplay()
+    display.run()
+    display.refine()
+
+    callback = display.per_capita_callback
+    assert (
+        callback in display.per_capita.js_property_callbacks["change:active"]
+    )
+    assert display.src in callback.args["sources"]
+    assert display.scale.args["toggle"] is display.per_capita
+    assert display.scale.args["source"] is display.src
+
+    display.per_capita.active = 1
+    display.data_getter.active = display.data_getter.labels.index("Deaths")
+
+    assert callback.args["labels"] == [
+        "Total New Deaths",
+        "New Deaths per 100,000",
+    ]
+
+    data = display.src.data
+    _, _, expected, expected_avg, *_ = covid.get_data(
+        display.state, True, "deaths", None, covid.ROLLING_DAYS
+    )
+    np.testing.assert_allclose(
+        data["data"] / data["scale"], expected.values[::-1]
+    )
+    np.testing.assert_allclose(
+        data["avg_data"] / data["scale"], expected_avg.values[::-1]
+    )
@@ -0,0 +1,90 @@
+import glob
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import covid
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+
+def write_inputs():
+
+    for name in ("pop_data.csv", "nnl-sites.csv", "nnl-covid.csv"):
+        shutil.copy(os.path.join(REPO, name), name)
+
+    rng = np.random.default_rng(0)
+    dates = pd.date_range("2020-06-01", periods=30)
+
+    os.makedirs("covid-19-data")
+
+    states = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "date": dates,
+                    "state": state,
+                    "fips": fips,
+                    "cases": np.cumsum(rng.integers(10, 100, len(dates))),
+                    "deaths": np.cumsum(rng.integers(0, 5, len(dates))),
+                }
+            )
+            for state, fips in (("New York", 36), ("Idaho", 16))
+        ]
+    )
+    states.to_csv(os.path.join("covid-19-data", "us-states.csv"), index=False)
+
+    counties = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "date": dates,
+                    "county": county,
+                    "state": state,
+                    "fips": fips,
+                    "cases": np.cumsum(rng.integers(1, 10, len(dates))),
+                    "deaths": np.cumsum(rng.integers(0, 2, len(dates))),
+                }
+            )
+            for county, state, fips in (
+                ("Albany", "New York", 36001),
+                ("Ada", "Idaho", 16001),
+            )
+        ]
+    )
+    counties.to_csv(
+        os.path.join("covid-19-data", "us-counties.csv"), index=False
+    )
+
+    tracking = [
+        {
+            "date": int(day.strftime("%Y%m%d")),
+            "state": state,
+            "positive": 100 * (i + 1),
+            "positiveIncrease": 100,
+            "totalTestResults": 1000 * (i + 1),
+            "totalTestResultsIncrease": 1000,
+        }
+        for i, day in enumerate(dates)
+        for state in ("NY", "ID")
+    ]
+    with open(covid.TRACKING_FILE, "w") as fileobj:
+        json.dump(tracking, fileobj)
+
+
+def test_preprocess_twice_leaves_no_temporary_files(tmp_path, monkeypatch):
+
+    monkeypatch.chdir(tmp_path)
+    write_inputs()
+
+    first, _ = covid.preprocess()
+    second, _ = covid.preprocess()
+
+    assert first == second
+    assert glob.glob("*.tmp") == []
+    assert glob.glob(os.path.join(covid.OUTPUT_DIR, "*.tmp")) == []
+    for sources, output, stage, config in covid.STAGES.values():
+        assert os.path.exists(output)